@@ -3,16 +3,37 @@
 #----------------------------------------------------------------------------#
 
 import json
+import hashlib
+import sqlite3
+import csv
+import time
+import click
 import dateutil.parser
 import babel
-from flask import Flask, render_template, request, Response, flash, redirect, url_for
+from babel.dates import LC_TIME, parse_pattern
+from functools import lru_cache
+from collections import Counter, defaultdict
+from flask import Flask, render_template, request, Response, flash, redirect, url_for, abort, session, make_response, g, has_app_context
+from flask import Blueprint, stream_with_context, jsonify
 from flask_moment import Moment
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import FunctionElement
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import selectinload
 from flask_migrate import Migrate
 import logging
-from logging import Formatter, FileHandler
+import atexit
+from logs import file_handler_from_config, queued_handler
 from flask_wtf import Form
 from forms import *
+from search import NgramIndex
+from cache import page_cache_from_config
+from metrics import TimedQueuePool, pool_metrics, render_metrics, QueryStats, active_recorders
+from functools import wraps
 from datetime import date
 import phonenumbers
 from wtforms import ValidationError
@@ -25,38 +46,111 @@ app = Flask(__name__)
 moment = Moment(app)
 app.config.from_object('config')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+# time connection checkouts when the app runs its own connection pool
+if 'pool_size' in app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {}):
+  app.config['SQLALCHEMY_ENGINE_OPTIONS'].setdefault('poolclass', TimedQueuePool)
 db = SQLAlchemy(app)
 migrate = Migrate(app, db)
 
+# default and maximum number of shows listed on one page of /shows
+SHOWS_PER_PAGE = 30
+MAX_SHOWS_PER_PAGE = 100
+
+# maximum number of results returned by venue and artist search
+SEARCH_RESULTS_LIMIT = 50
+
 #----------------------------------------------------------------------------#
 # Models.
 #----------------------------------------------------------------------------#
 
+# current UTC time in SQL, for server defaults of UTC timestamps: Postgres'
+# now() is in the session's time zone, SQLite's CURRENT_TIMESTAMP is UTC
+class utcnow(FunctionElement):
+  type = db.DateTime()
+
+@compiles(utcnow)
+def compile_utcnow(element, compiler, **kw):
+  return 'CURRENT_TIMESTAMP'
+
+@compiles(utcnow, 'postgresql')
+def compile_utcnow_postgresql(element, compiler, **kw):
+  return "timezone('utc', now())"
+
+# a list of genres: an array on Postgres, a JSON list on SQLite (e.g. in tests)
+GENRES_ARRAY = postgresql.ARRAY(db.String())
+GENRES_TYPE = GENRES_ARRAY.with_variant(db.JSON(), 'sqlite')
+
+class Area(db.Model):
+    __tablename__ = 'area'
+    __table_args__ = (
+      # also serves the listing of the areas of a state
+      db.UniqueConstraint('state', 'city'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    city = db.Column(db.String(120), nullable=False)
+    state = db.Column(db.String(120), nullable=False)
+
+    venues = db.relationship('Venue', backref='area', lazy=True)
+
+    def __repr__(self):
+      return f'<Area {self.id} {self.city}, {self.state}>'
+
 class Venue(db.Model):
     __tablename__ = 'venue'
+    __table_args__ = (
+      # trigram index serving the partial, case-insensitive name search
+      db.Index('ix_venue_name_trgm', 'name',
+               postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'}),
+      # serves the genres @> ARRAY[genre] filter
+      db.Index('ix_venue_genres', 'genres', postgresql_using='gin'),
+      # with the genres index, serves the candidates of the artist matches,
+      # OR-ed together by a bitmap scan
+      db.Index('ix_venue_state', 'state'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String, nullable=False)
-    genres = db.Column("genres", db.ARRAY(db.String()), nullable=False)
+    # the Postgres ARRAY type, the generic one has no @> and && operators;
+    # stored as JSON on SQLite, see has_genre() and shares_genre()
+    genres = db.Column("genres", GENRES_TYPE, nullable=False)
     address = db.Column(db.String(120), nullable=False)
     city = db.Column(db.String(120), nullable=False)
     state = db.Column(db.String(120), nullable=False)    
+    # area of (city, state), kept in step with them on every flush
+    area_id = db.Column(db.Integer, db.ForeignKey('area.id'), nullable=False, index=True)
     phone = db.Column(db.String(120), nullable=False)
     website = db.Column(db.String(120))
     facebook_link = db.Column(db.String(120))
     seeking_talent = db.Column(db.Boolean, default=False)
     seeking_description = db.Column(db.String(500))
     image_link = db.Column(db.String(500))
-
-    shows = db.relationship('Show', backref='venue', lazy=True)
+    # show counters, valid as of show_counts_at: shows starting after it are
+    # counted as upcoming, the rollover-shows command moves them to past.
+    # Like start_time, show_counts_at is in the app's local time; it has no
+    # server default, the database's now() may be in another time zone
+    upcoming_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    past_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    show_counts_at = db.Column(db.DateTime, nullable=False, default=datetime.now)
+    # in UTC, sent as the Last-Modified of the detail pages
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow, server_default=utcnow())
+
+    # shows are deleted by the database's ON DELETE CASCADE, never loaded for it
+    shows = db.relationship('Show', backref='venue', lazy=True,
+                            cascade='all, delete', passive_deletes=True)
 
     def __repr__(self):
       return f'<Venue {self.id} {self.name}>'
     
 class Artist(db.Model):
     __tablename__ = 'artist'
+    __table_args__ = (
+      db.Index('ix_artist_name_trgm', 'name',
+               postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'}),
+      db.Index('ix_artist_genres', 'genres', postgresql_using='gin'),
+      db.Index('ix_artist_state', 'state'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String, nullable=False)
-    genres = db.Column("genres", db.ARRAY(db.String()), nullable=False)
+    genres = db.Column("genres", GENRES_TYPE, nullable=False)
     city = db.Column(db.String(120), nullable=False)
     state = db.Column(db.String(120), nullable=False)
     phone = db.Column(db.String(120))
@@ -65,37 +159,747 @@ class Artist(db.Model):
     website = db.Column(db.String(120))
     seeking_venue = db.Column(db.Boolean, default=False)
     seeking_description = db.Column(db.String(120))
-    shows = db.relationship('Show', backref='artist', lazy=True)
+    upcoming_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    past_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    show_counts_at = db.Column(db.DateTime, nullable=False, default=datetime.now)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow, server_default=utcnow())
+    shows = db.relationship('Show', backref='artist', lazy=True,
+                            cascade='all, delete', passive_deletes=True)
 
     def __repr__(self):
         return f'<Artist {self.id} {self.name}>'
 
 class Show(db.Model):
     __tablename__ = 'show'
+    __table_args__ = (
+      # the shows of a venue or an artist, in time order
+      db.Index('ix_show_venue_id_start_time', 'venue_id', 'start_time'),
+      db.Index('ix_show_artist_id_start_time', 'artist_id', 'start_time'),
+      # the keyset pagination order of /shows and /api/v1/shows
+      db.Index('ix_show_start_time_id', 'start_time', 'id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
-    artist_id = db.Column(db.Integer, db.ForeignKey('artist.id'), nullable=False)
-    venue_id = db.Column(db.Integer, db.ForeignKey('venue.id'), nullable=False)
+    artist_id = db.Column(db.Integer, db.ForeignKey('artist.id', ondelete='CASCADE'), nullable=False)
+    venue_id = db.Column(db.Integer, db.ForeignKey('venue.id', ondelete='CASCADE'), nullable=False)
     start_time = db.Column(db.DateTime, nullable=False)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow, server_default=utcnow())
+
+class Match(db.Model):
+    # an artist seeking venues recommended to a venue seeking talent, with its
+    # score; precomputed and refreshed whenever either side is written
+    __tablename__ = 'match'
+    __table_args__ = (
+      # a venue's matches, best first
+      db.Index('ix_match_venue_id_score', 'venue_id', 'score'),
+      db.Index('ix_match_artist_id', 'artist_id'),
+    )
+    venue_id = db.Column(db.Integer, db.ForeignKey('venue.id', ondelete='CASCADE'), primary_key=True)
+    artist_id = db.Column(db.Integer, db.ForeignKey('artist.id', ondelete='CASCADE'), primary_key=True)
+    score = db.Column(db.Integer, nullable=False)
+
+# SQLite only enforces foreign keys, and so the ON DELETE CASCADE of shows
+# and matches, when they are turned on for the connection
+@event.listens_for(Engine, 'connect')
+def enable_sqlite_foreign_keys(dbapi_connection, connection_record):
+  if isinstance(dbapi_connection, sqlite3.Connection):
+    cursor = dbapi_connection.cursor()
+    cursor.execute('PRAGMA foreign_keys=ON')
+    cursor.close()
+
+# ids of the areas of (city, state) pairs, creating the missing ones;
+# for bulk inserts that bypass assign_venue_areas
+def area_ids(pairs):
+  pairs = set(pairs)
+
+  def existing():
+    areas = db.session.query(Area.id, Area.city, Area.state)\
+      .filter(Area.state.in_({state for city, state in pairs}))\
+      .filter(Area.city.in_({city for city, state in pairs}))
+    return {(city, state): id for id, city, state in areas if (city, state) in pairs}
+
+  ids = existing()
+  missing = pairs - ids.keys()
+  if missing:
+    db.session.execute(Area.__table__.insert(), [{"city": city, "state": state} for city, state in missing])
+    ids = existing()
+  return ids
+
+# points new and edited venues to the area of their city and state
+@event.listens_for(db.session, 'before_flush')
+def assign_venue_areas(session, flush_context, instances):
+  venues = [obj for obj in list(session.new) + list(session.dirty) if isinstance(obj, Venue)]
+  if not venues:
+    return
+  pairs = {(venue.city, venue.state) for venue in venues}
+  areas = {(area.city, area.state): area for area in session.new if isinstance(area, Area)}
+  for area in session.query(Area)\
+      .filter(Area.state.in_({state for city, state in pairs}))\
+      .filter(Area.city.in_({city for city, state in pairs})):
+    areas.setdefault((area.city, area.state), area)
+  for venue in venues:
+    key = (venue.city, venue.state)
+    if key not in areas:
+      areas[key] = Area(city=venue.city, state=venue.state)
+      session.add(areas[key])
+    venue.area = areas[key]
+
+# in-process name indexes searched when the database has no pg_trgm,
+# marked stale on every write to their table and rebuilt on the next search
+search_indexes = {
+  Venue: NgramIndex(),
+  Artist: NgramIndex()
+}
+
+def invalidate_search_index(mapper, connection, target):
+  search_indexes[type(target)].invalidate()
+
+for model in search_indexes:
+  for event_name in ('after_insert', 'after_update', 'after_delete'):
+    event.listen(model, event_name, invalidate_search_index)
+
+# condition on the entities listing genre, served by the genres GIN index;
+# on SQLite the JSON text of the list is searched for the quoted genre.
+# The lists are cast, binds of a variant type are not typed as arrays
+def has_genre(model, genre):
+  if db.engine.dialect.name == 'postgresql':
+    return model.genres.contains(db.cast([genre], GENRES_ARRAY))
+  return db.cast(model.genres, db.String).contains(json.dumps(genre), autoescape=True)
+
+# condition on the entities listing any of genres
+def shares_genre(model, genres):
+  if db.engine.dialect.name == 'postgresql':
+    return model.genres.overlap(db.cast(genres, GENRES_ARRAY))
+  return db.or_(*(has_genre(model, genre) for genre in genres or []))
 
 #----------------------------------------------------------------------------#
 # Filters.
 #----------------------------------------------------------------------------#
 
-def format_datetime(value, format='medium'):
-  date = dateutil.parser.parse(value)
-  if format == 'full':
-      format="EEEE MMMM, d, y 'at' h:mma"
-  elif format == 'medium':
-      format="EE MM, dd, y h:mma"
-  return babel.dates.format_datetime(date, format)
- 
+# named formats accepted by the datetime filter
+DATETIME_FORMATS = {
+  'full': "EEEE MMMM, d, y 'at' h:mma",
+  'medium': "EE MM, dd, y h:mma"
+}
+
+# babel patterns and locales are parsed once per (format, locale)
+@lru_cache(maxsize=64)
+def datetime_pattern(format, locale):
+  return parse_pattern(DATETIME_FORMATS.get(format, format)), babel.Locale.parse(locale)
+
+def format_datetime(value, format='medium', locale=LC_TIME):
+  # views pass native datetimes, strings are still parsed for older callers
+  if isinstance(value, str):
+    value = dateutil.parser.parse(value)
+  pattern, locale = datetime_pattern(format, locale)
+  return pattern.apply(value, locale)
+
 app.jinja_env.filters['datetime'] = format_datetime
 
-# validates user phone numbers
-def phone_validation(num):
-    parsed = phonenumbers.parse(num, "US")
+# E.164 form of a phone number, None when it is not a valid number;
+# cached since parsing and validating with libphonenumber metadata is costly
+@lru_cache(maxsize=4096)
+def normalize_phone(num):
+    if not num:
+        return None
+    try:
+        parsed = phonenumbers.parse(num, "US")
+    except phonenumbers.NumberParseException:
+        return None
     if not phonenumbers.is_valid_number(parsed):
+        return None
+    return phonenumbers.format_number(parsed, phonenumbers.PhoneNumberFormat.E164)
+
+# validates user phone numbers, returns them in E.164 form to be stored
+def phone_validation(num):
+    normalized = normalize_phone(num)
+    if normalized is None:
         raise ValidationError('Must enter a valid phone number.')
+    return normalized
+
+# E.164 forms of many phone numbers, None for the invalid ones;
+# every distinct number is only validated once
+def validate_many(nums):
+    normalized = {num: normalize_phone(num) for num in set(nums)}
+    return [normalized[num] for num in nums]
+#----------------------------------------------------------------------------#
+# Queries.
+#----------------------------------------------------------------------------#
+
+# groups venues by area with the number of upcoming shows of each venue,
+# read from the venue's show counter
+def venue_areas(city=None, state=None, genre=None):
+  # optionally scoped to one state or one city, served by the area indexes
+  query = db.session.query(Area.city, Area.state, Venue.id, Venue.name, Venue.upcoming_shows_count)\
+    .join(Venue, Venue.area_id == Area.id)
+  if genre:
+    query = query.filter(has_genre(Venue, genre))
+  if state:
+    query = query.filter(Area.state == state)
+  if city:
+    query = query.filter(Area.city == city)
+  rows = query.order_by(Area.state, Area.city, Venue.id).all()
+
+  # rows arrive sorted by area, so a new area starts whenever (city, state) changes
+  data = []
+  for city, state, venue_id, name, total_upcoming_shows in rows:
+    if not data or data[-1]["city"] != city or data[-1]["state"] != state:
+      data.append({
+        "city": city,
+        "state": state,
+        "venues": []
+      })
+    data[-1]["venues"].append({
+      "id": venue_id,
+      "name": name,
+      "upcoming_shows": total_upcoming_shows
+    })
+  return data
+
+# loads a venue together with its shows and the artist of every show:
+# one query for the venue and one for its shows joined with their artists
+def load_venue(venue_id):
+  return Venue.query\
+    .options(selectinload(Venue.shows).joinedload(Show.artist))\
+    .filter_by(id = venue_id)\
+    .first_or_404()
+
+# loads an artist together with its shows and the venue of every show
+def load_artist(artist_id):
+  return Artist.query\
+    .options(selectinload(Artist.shows).joinedload(Show.venue))\
+    .filter_by(id = artist_id)\
+    .first_or_404()
+
+# a venue with its past and upcoming shows, as shown on its page
+def venue_details(venue_id):
+  # retrieve the venue with its shows and their artists already loaded
+  venue = load_venue(venue_id)
+
+  # filter shows based on their date
+  past_shows, upcoming_shows = split_shows(venue.shows, lambda show: {
+    "artist_id": show.artist_id,
+    "artist_name": show.artist.name,
+    "artist_image_link": show.artist.image_link,
+    "start_time": show.start_time
+  })
+  # data is the object will store the data of the venue and it's shows
+  data = {
+    "id": venue.id,
+    "name": venue.name,
+    "genres": venue.genres,
+    "address": venue.address,
+    "city": venue.city,
+    "state": venue.state,
+    "phone": venue.phone,
+    "website": venue.website,
+    "facebook_link": venue.facebook_link,
+    "seeking_talent": venue.seeking_talent,
+    "seeking_description": venue.seeking_description,
+    "image_link": venue.image_link,
+    "past_shows": past_shows,
+    "past_shows_count": len(past_shows),
+    "upcoming_shows": upcoming_shows,
+    "upcoming_shows_count": len(upcoming_shows)
+  }
+  return data
+
+# an artist with its past and upcoming shows, as shown on its page
+def artist_details(artist_id):
+  # retrieve the artist with its shows and their venues already loaded
+  artist = load_artist(artist_id)
+
+  # filter shows as past and upcoming shows
+  past_shows, upcoming_shows = split_shows(artist.shows, lambda show: {
+    "venue_id": show.venue_id,
+    "venue_name": show.venue.name,
+    "venue_image_link": show.venue.image_link,
+    "start_time": show.start_time
+  })
+  # object to store the artist data along with list of upcoming and past shows
+  data = {
+    "id": artist.id,
+    "name": artist.name,
+    "genres": artist.genres,
+    "city": artist.city,
+    "state": artist.state,
+    "phone": artist.phone,
+    "website": artist.website,
+    "facebook_link": artist.facebook_link,
+    "seeking_venue": artist.seeking_venue,
+    "image_link": artist.image_link,
+    "past_shows": past_shows,
+    "past_shows_count": len(past_shows),
+    "upcoming_shows": upcoming_shows,
+    "upcoming_shows_count": len(upcoming_shows)
+  }
+  return data
+
+# weak ETag and Last-Modified of a venue or artist detail page, computed by
+# one aggregate query over the entity, its shows and their counterparts;
+# the number of upcoming shows is part of the tag since shows move to past
+def detail_validators(model, entity_id, now=None):
+  if now is None:
+    now = datetime.now()
+  if model is Venue:
+    key, counterpart, counterpart_key = Show.venue_id, Artist, Show.artist_id
+  else:
+    key, counterpart, counterpart_key = Show.artist_id, Venue, Show.venue_id
+
+  row = db.session.query(model.updated_at,
+                         db.func.max(Show.updated_at),
+                         db.func.max(counterpart.updated_at),
+                         db.func.count(Show.id),
+                         db.func.count(Show.id).filter(Show.start_time > now))\
+    .outerjoin(Show, key == model.id)\
+    .outerjoin(counterpart, counterpart.id == counterpart_key)\
+    .filter(model.id == entity_id)\
+    .group_by(model.id)\
+    .first()
+  if row is None:
+    abort(404)
+
+  # updated_at is in UTC, as Last-Modified expects
+  etag = hashlib.sha1(repr(tuple(row)).encode('utf-8')).hexdigest()
+  last_modified = max(updated_at for updated_at in row[:3] if updated_at is not None)
+  return etag, last_modified
+
+# the 304 response to send when the client's copy of the page is still current
+def not_modified(etag, last_modified):
+  # a page carrying pending flash messages is always rendered
+  if session.get('_flashes') or not request.if_none_match.contains_weak(etag):
+    return None
+  response = Response(status=304)
+  response.set_etag(etag, weak=True)
+  response.last_modified = last_modified
+  return response
+
+def with_validators(page, etag, last_modified):
+  response = make_response(page)
+  response.set_etag(etag, weak=True)
+  response.last_modified = last_modified
+  return response
+
+# splits already loaded shows into (past, upcoming) around a single timestamp,
+# formatting each of them with to_dict
+def split_shows(shows, to_dict, now=None):
+  if now is None:
+    now = datetime.now()
+  past_shows = []
+  upcoming_shows = []
+  for show in sorted(shows, key=lambda show: show.start_time):
+    if show.start_time > now:
+      upcoming_shows.append(to_dict(show))
+    else:
+      past_shows.append(to_dict(show))
+  return past_shows, upcoming_shows
+
+# a page of shows ordered by (start_time, id), continuing after the given
+# cursor; returns the rows of the page and the cursor of the next page
+def shows_page(cursor=None, per_page=SHOWS_PER_PAGE):
+  query = db.session.query(Show.id, Show.start_time,
+                           Show.venue_id, Venue.name,
+                           Show.artist_id, Artist.name, Artist.image_link)\
+    .join(Venue, Venue.id == Show.venue_id)\
+    .join(Artist, Artist.id == Show.artist_id)
+
+  # seek past the last show of the previous page instead of using an offset
+  if cursor is not None:
+    query = query.filter(db.tuple_(Show.start_time, Show.id) > cursor)
+
+  # fetch one extra row to know whether there is a next page
+  rows = query.order_by(Show.start_time, Show.id).limit(per_page + 1).all()
+
+  next_cursor = None
+  if len(rows) > per_page:
+    rows = rows[:per_page]
+    next_cursor = encode_show_cursor(rows[-1].start_time, rows[-1].id)
+  return rows, next_cursor
+
+# search_term with the LIKE wildcards and the escape character escaped
+def escape_like(search_term):
+  return search_term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+# (id, name) of the venues or artists whose name contains search_term,
+# case-insensitive, best matches first
+def search_by_name(model, search_term, genre=None, limit=SEARCH_RESULTS_LIMIT):
+  if db.engine.dialect.name == 'postgresql':
+    # the ILIKE is served by the pg_trgm GIN index, similarity ranks the matches;
+    # % and _ are escaped, they match themselves as in the in-process index
+    rank = db.func.similarity(model.name, search_term)
+    query = db.session.query(model.id, model.name)\
+      .filter(model.name.ilike(f"%{escape_like(search_term)}%", escape='\\'))
+    if genre:
+      query = query.filter(has_genre(model, genre))
+    return query.order_by(rank.desc(), model.id)\
+      .limit(limit)\
+      .all()
+
+  index = search_indexes[model]
+  if index.stale:
+    index.rebuild(db.session.query(model.id, model.name))
+  if not genre:
+    return index.search(search_term, limit)
+  # the genre is checked on the name matches, ranked by the index
+  matches = index.search(search_term, len(index.texts))
+  listing = {id for id, in db.session.query(model.id)
+             .filter(model.id.in_([id for id, name in matches]))
+             .filter(has_genre(model, genre))}
+  return [(id, name) for id, name in matches if id in listing][:limit]
+
+# (genre, count) of the venues or artists listing each genre, most listed
+# first, counted by one grouped query over the unnested genres arrays;
+# scoped like the listing they are shown with: to the entities listing genre,
+# and for venues to one state or one city, through the area indexes
+def genre_facets(model, city=None, state=None, genre=None):
+  def scoped(query):
+    if genre:
+      query = query.filter(has_genre(model, genre))
+    if state or city:
+      query = query.join(Area, Area.id == model.area_id)
+    if state:
+      query = query.filter(Area.state == state)
+    if city:
+      query = query.filter(Area.city == city)
+    return query
+
+  if db.engine.dialect.name != 'postgresql':
+    # without unnest the genres are counted here
+    counts = Counter(name for genres, in scoped(db.session.query(model.genres)) for name in genres or [])
+    return sorted(counts.items(), key=lambda facet: (-facet[1], facet[0]))
+  genres = scoped(db.session.query(db.func.unnest(model.genres).label('genre'))).subquery()
+  return db.session.query(genres.c.genre, db.func.count())\
+    .group_by(genres.c.genre)\
+    .order_by(db.func.count().desc(), genres.c.genre)\
+    .all()
+
+# cursors are opaque to clients, they carry the (start_time, id) of the last show
+def encode_show_cursor(start_time, show_id):
+  return f'{start_time.strftime("%Y%m%dT%H%M%S%f")}.{show_id}'
+
+def decode_show_cursor(cursor):
+  try:
+    start_time, show_id = cursor.split('.')
+    return datetime.strptime(start_time, "%Y%m%dT%H%M%S%f"), int(show_id)
+  except ValueError:
+    abort(400)
+
+#----------------------------------------------------------------------------#
+# Page cache.
+#----------------------------------------------------------------------------#
+
+# rendered listing pages, keyed by path and query string
+page_cache = page_cache_from_config(app.config)
+
+# serves the page from the cache when possible, otherwise renders and caches it
+def cached_page(view):
+  @wraps(view)
+  def wrapper(*args, **kwargs):
+    # pages rendering pending flash messages are not shared
+    if session.get('_flashes'):
+      return view(*args, **kwargs)
+    key = request.full_path
+    page = page_cache.get(key)
+    if page is None:
+      page = view(*args, **kwargs)
+      page_cache.set(key, page)
+    return page
+  return wrapper
+
+# called after every committed write to venues, artists or shows
+def invalidate_pages():
+  page_cache.clear()
+
+#----------------------------------------------------------------------------#
+# Show counters.
+#----------------------------------------------------------------------------#
+
+# the show column referencing each model keeping show counters
+SHOW_COUNTER_KEYS = {
+  Venue: Show.venue_id,
+  Artist: Show.artist_id
+}
+
+# adds (delta=1) or removes (delta=-1) a show from the counters of its venue
+# and artist, in the current transaction; the show is upcoming for an entity
+# when it starts after the time the entity's counters are valid for
+def adjust_show_counters(show, delta):
+  for model, key in SHOW_COUNTER_KEYS.items():
+    upcoming = db.case([(model.show_counts_at < show.start_time, delta)], else_=0)
+    past = db.case([(model.show_counts_at < show.start_time, 0)], else_=delta)
+    model.query.filter(model.id == getattr(show, key.key)).update({
+      model.upcoming_shows_count: model.upcoming_shows_count + upcoming,
+      model.past_shows_count: model.past_shows_count + past
+    }, synchronize_session=False)
+
+# recounts the upcoming and past shows of the entities matching criteria,
+# making their counters valid as of now
+def recount_show_counters(model, criteria, now=None):
+  if now is None:
+    now = datetime.now()
+  key = SHOW_COUNTER_KEYS[model]
+
+  def count_shows(*criteria):
+    return db.select([db.func.count(Show.id)]).where(key == model.id).where(db.and_(*criteria)).as_scalar()
+
+  return model.query.filter(criteria).update({
+    model.upcoming_shows_count: count_shows(Show.start_time > now),
+    model.past_shows_count: count_shows(Show.start_time <= now),
+    model.show_counts_at: now
+  }, synchronize_session=False)
+
+# recounts the shows of the entities having shows that started since their
+# counters were last valid, so their upcoming shows move to past as time passes
+def rollover_show_counters(model, now=None):
+  if now is None:
+    now = datetime.now()
+  key = SHOW_COUNTER_KEYS[model]
+  crossed = db.exists().where(key == model.id)\
+    .where(Show.start_time > model.show_counts_at)\
+    .where(Show.start_time <= now)
+  return recount_show_counters(model, crossed, now)
+
+@app.cli.command('rollover-shows')
+def rollover_shows_command():
+  """Moves shows that have started from the upcoming to the past counters."""
+  # run it periodically, e.g. from cron every few minutes
+  now = datetime.now()
+  venues = rollover_show_counters(Venue, now)
+  artists = rollover_show_counters(Artist, now)
+  db.session.commit()
+  invalidate_pages()
+  print(f'Rolled over show counters of {venues} venues and {artists} artists.')
+
+#----------------------------------------------------------------------------#
+# Matches.
+#----------------------------------------------------------------------------#
+
+# weight of every shared genre, of being in the same state and in the same city
+MATCH_GENRE_WEIGHT = 2
+MATCH_STATE_WEIGHT = 1
+MATCH_CITY_WEIGHT = 2
+
+# (genres, city, state) of a venue and of an artist -> recommendation score
+def match_score(venue, artist):
+  venue_genres, venue_city, venue_state = venue
+  artist_genres, artist_city, artist_state = artist
+  score = MATCH_GENRE_WEIGHT * len(set(venue_genres or []) & set(artist_genres or []))
+  if venue_state == artist_state:
+    score += MATCH_STATE_WEIGHT
+    if venue_city == artist_city:
+      score += MATCH_CITY_WEIGHT
+  return score
+
+# recomputes the matches of a venue from the artists seeking venues that share
+# a genre or its state, both conditions served by an index (genres GIN, state)
+def refresh_venue_matches(venue):
+  Match.query.filter_by(venue_id = venue.id).delete(synchronize_session=False)
+  if not venue.seeking_talent:
+    return
+  profile = (venue.genres, venue.city, venue.state)
+  candidates = db.session.query(Artist.id, Artist.genres, Artist.city, Artist.state)\
+    .filter(Artist.seeking_venue.is_(True))\
+    .filter(db.or_(shares_genre(Artist, venue.genres), Artist.state == venue.state))
+  db.session.bulk_insert_mappings(Match, [{
+    "venue_id": venue.id,
+    "artist_id": artist_id,
+    "score": match_score(profile, (genres, city, state))
+  } for artist_id, genres, city, state in candidates])
+
+# recomputes the matches of an artist with the venues seeking talent
+def refresh_artist_matches(artist):
+  Match.query.filter_by(artist_id = artist.id).delete(synchronize_session=False)
+  if not artist.seeking_venue:
+    return
+  profile = (artist.genres, artist.city, artist.state)
+  candidates = db.session.query(Venue.id, Venue.genres, Venue.city, Venue.state)\
+    .filter(Venue.seeking_talent.is_(True))\
+    .filter(db.or_(shares_genre(Venue, artist.genres), Venue.state == artist.state))
+  db.session.bulk_insert_mappings(Match, [{
+    "venue_id": venue_id,
+    "artist_id": artist.id,
+    "score": match_score((genres, city, state), profile)
+  } for venue_id, genres, city, state in candidates])
+
+# artists recommended to a venue, best first, read from the match index
+def venue_matches(venue_id, limit):
+  return db.session.query(Artist.id, Artist.name, Artist.genres, Artist.city, Artist.state, Match.score)\
+    .join(Match, Match.artist_id == Artist.id)\
+    .filter(Match.venue_id == venue_id)\
+    .order_by(Match.score.desc(), Artist.id)\
+    .limit(limit)\
+    .all()
+
+@app.cli.command('refresh-matches')
+def refresh_matches_command():
+  """Recomputes the matches of every venue, e.g. after an import."""
+  venues = Venue.query.filter(Venue.seeking_talent.is_(True)).all()
+  for venue in venues:
+    refresh_venue_matches(venue)
+  db.session.commit()
+  print(f'Refreshed the matches of {len(venues)} venues.')
+
+#----------------------------------------------------------------------------#
+# Import.
+#----------------------------------------------------------------------------#
+
+# model and importable columns of every kind of record
+IMPORT_KINDS = {
+  'venues': (Venue, ['name', 'genres', 'address', 'city', 'state', 'phone', 'website',
+                     'facebook_link', 'seeking_talent', 'seeking_description', 'image_link']),
+  'artists': (Artist, ['name', 'genres', 'city', 'state', 'phone', 'website',
+                       'facebook_link', 'seeking_venue', 'seeking_description', 'image_link']),
+  'shows': (Show, ['artist_id', 'venue_id', 'start_time'])
+}
+
+# yields (line number, record) of a CSV or NDJSON file one at a time,
+# NDJSON lines are left undecoded so a malformed one only rejects itself
+def read_records(file, format):
+  if format == 'csv':
+    reader = csv.DictReader(file)
+    for record in reader:
+      yield reader.line_num, record
+  else:
+    for line, text in enumerate(file, 1):
+      if text.strip():
+        yield line, text
+
+# converts a raw record into the column values of its model, raises
+# ValueError when it is invalid; phones are validated per batch by import_batch
+def import_values(model, columns, record):
+  if isinstance(record, str):
+    record = json.loads(record)
+  if not isinstance(record, dict):
+    raise ValueError('Record must be an object.')
+  values = {}
+  for column in columns:
+    value = record.get(column)
+    if value == '':
+      value = None
+    if column == 'genres' and isinstance(value, str):
+      value = [genre.strip() for genre in value.split(',') if genre.strip()]
+    elif column in ('seeking_talent', 'seeking_venue'):
+      value = value in (True, 'Yes', 'yes', 'True', 'true', '1')
+    elif column in ('artist_id', 'venue_id') and value is not None:
+      value = int(value)
+    elif column == 'start_time' and isinstance(value, str):
+      value = dateutil.parser.parse(value)
+    if value is None and not model.__table__.c[column].nullable:
+      raise ValueError(f'{column} is required.')
+    values[column] = value
+  return values
+
+# normalizes the phone numbers of a batch in place, validating every
+# distinct number once; returns the (line, error) of the invalid ones
+def invalid_phones(batch):
+  phoned = [(line, row) for line, row in batch if row.get('phone') is not None]
+  invalid = []
+  for (line, row), phone in zip(phoned, validate_many([row['phone'] for line, row in phoned])):
+    if phone is None:
+      invalid.append((line, 'Must enter a valid phone number.'))
+    else:
+      row['phone'] = phone
+  return invalid
+
+# (line, error) of the shows of a batch whose venue or artist does not exist
+def missing_references(model, batch):
+  if model is not Show:
+    return []
+  venue_ids = {id for id, in db.session.query(Venue.id)
+               .filter(Venue.id.in_({row['venue_id'] for line, row in batch}))}
+  artist_ids = {id for id, in db.session.query(Artist.id)
+                .filter(Artist.id.in_({row['artist_id'] for line, row in batch}))}
+  missing = []
+  for line, row in batch:
+    if row['venue_id'] not in venue_ids:
+      missing.append((line, f'Venue {row["venue_id"]} not found.'))
+    elif row['artist_id'] not in artist_ids:
+      missing.append((line, f'Artist {row["artist_id"]} not found.'))
+  return missing
+
+# inserts rows with a single executemany
+def insert_rows(model, rows):
+  if model is Venue:
+    ids = area_ids((row['city'], row['state']) for row in rows)
+    for row in rows:
+      row['area_id'] = ids[(row['city'], row['state'])]
+  db.session.execute(model.__table__.insert(), rows)
+
+# inserts a batch of (line, row) and commits it; returns the number of rows
+# imported and the (line, error) of the rejected ones
+def import_batch(model, batch):
+  rejected = invalid_phones(batch) + missing_references(model, batch)
+  rejected_lines = {line for line, error in rejected}
+  batch = [(line, row) for line, row in batch if line not in rejected_lines]
+  try:
+    if batch:
+      insert_rows(model, [row for line, row in batch])
+  except SQLAlchemyError:
+    # the database refused a row, find it by inserting them one at a time
+    db.session.rollback()
+    inserted = []
+    for line, row in batch:
+      try:
+        with db.session.begin_nested():
+          insert_rows(model, [row])
+        inserted.append((line, row))
+      except SQLAlchemyError as e:
+        rejected.append((line, str(getattr(e, 'orig', e)).strip()))
+    batch = inserted
+  if model is Show and batch:
+    # bulk inserts bypass adjust_show_counters, recount the touched entities
+    for counted, key in SHOW_COUNTER_KEYS.items():
+      ids = {row[key.key] for line, row in batch}
+      recount_show_counters(counted, counted.id.in_(ids))
+  db.session.commit()
+  return len(batch), sorted(rejected)
+
+@app.cli.command('import')
+@click.argument('kind', type=click.Choice(sorted(IMPORT_KINDS)))
+@click.argument('file', type=click.File('r', encoding='utf-8'))
+@click.option('--format', type=click.Choice(['csv', 'ndjson']), default=None,
+              help='File format, guessed from the file extension by default.')
+@click.option('--batch-size', default=1000, show_default=True,
+              help='Rows inserted and committed per transaction.')
+def import_command(kind, file, format, batch_size):
+  """Imports venues, artists or shows from a CSV or NDJSON file."""
+  model, columns = IMPORT_KINDS[kind]
+  if format is None:
+    format = 'csv' if file.name.endswith('.csv') else 'ndjson'
+
+  start = time.perf_counter()
+  imported = 0
+  rejected = 0
+  batch = []
+
+  def flush_batch():
+    nonlocal imported, rejected
+    count, errors = import_batch(model, batch)
+    imported += count
+    rejected += len(errors)
+    for line, error in errors:
+      print(f'Record {line} rejected: {error}')
+    batch.clear()
+
+  for line, record in read_records(file, format):
+    try:
+      batch.append((line, import_values(model, columns, record)))
+    except (ValueError, TypeError, OverflowError) as e:
+      rejected += 1
+      print(f'Record {line} rejected: {e}')
+      continue
+    if len(batch) >= batch_size:
+      flush_batch()
+  if batch:
+    flush_batch()
+
+  if model in search_indexes:
+    search_indexes[model].invalidate()
+  invalidate_pages()
+
+  elapsed = time.perf_counter() - start
+  print(f'Imported {imported} {kind} ({rejected} rejected) in {elapsed:.1f}s, '
+        f'{imported / elapsed if elapsed else 0:.0f} rows/s.')
+
 #----------------------------------------------------------------------------#
 # Controllers.
 #----------------------------------------------------------------------------#
@@ -107,50 +911,19 @@ def index():
 #  ----------------------------------------------------------------
 
 @app.route('/venues')
+@cached_page
 def venues():
-  
-  # data will hold all venues returned
-  data = []
-
-  # Collect all the venues
-  venues = Venue.query.all()
-
-  # a set to store unique combination of city and state
-  venue_locations = set()
-
-  # store all combination into the set venue_locations
-  for location in venues:
-    venue_locations.add((location.city, location.state))
+  # venues grouped by city and state, with their upcoming shows counted by the db,
+  # optionally only the ones of ?state=NY or ?state=NY&city=New York, or ?genre=Jazz
+  scope = {
+    "city": request.args.get('city'),
+    "state": request.args.get('state'),
+    "genre": request.args.get('genre')
+  }
+  data = venue_areas(**scope)
 
-  # store all location inside the data object
-  for location in venue_locations:
-    data.append({
-      "city": location[0],
-      "state": location[1],
-      "venues": []
-    })
-
-  # find the upcoming shows for each venue, store venues in the data object
-  for venue in venues:
-    # get all shows for the current venue
-    shows = Show.query.filter_by(venue_id = venue.id).all()
-
-    # calculate number of upcoming shows
-    total_upcoming_shows = 0
-    for show in shows:
-      if show.start_time > datetime.now():
-        total_upcoming_shows +=1
-    # storing venue data into the specific location
-    for location in data:
-      if venue.city == location["city"] and venue.state == location["state"]:
-        location["venues"].append({
-          "id": venue.id,
-          "name": venue.name,
-          "upcoming_shows": total_upcoming_shows
-        })
-
-# pass data to the template
-  return render_template('pages/venues.html', areas=data)
+  # pass data to the template, with the number of listed venues of each genre
+  return render_template('pages/venues.html', areas=data, genres=genre_facets(Venue, **scope))
 
 @app.route('/venues/search', methods=['POST'])
 def search_venues():
@@ -158,8 +931,8 @@ def search_venues():
   # search term entered by user
   search_term = request.form.get('search_term', '')
 
-  # find venues with partial string search, case-insensitive
-  venues = Venue.query.filter(Venue.name.ilike(f"%{search_term}%")).all()
+  # find venues with partial string search, case-insensitive, best matches first
+  venues = search_by_name(Venue, search_term, genre=request.form.get('genre'))
 
   # response stores data result
   response = []
@@ -170,61 +943,25 @@ def search_venues():
     "data": []
   }
   # iterating each venue and add it to the response object
-  for venue in venues:
+  for venue_id, name in venues:
      response["data"].append({
-       "id": venue.id,
-       "name": venue.name
+       "id": venue_id,
+       "name": name
     })
  
   return render_template('pages/search_venues.html', results=response, search_term=request.form.get('search_term', ''))
 
 @app.route('/venues/<int:venue_id>')
 def show_venue(venue_id):
-  # data members to store the data of upcoming and past shows
-  upcoming_shows = []
-  past_shows = []
+  # nothing to render when the client already has the current page
+  etag, last_modified = detail_validators(Venue, venue_id)
+  response = not_modified(etag, last_modified)
+  if response is not None:
+    return response
 
-  # retrieve the venue using id 
-  venue = Venue.query.filter_by(id = venue_id ).first()
-
-  # retrieve all shows for this venue
-  shows = Show.query.filter_by(venue_id = venue_id).all()
-  # filter shows based on their date 
-  for show in shows:
-    if show.start_time > datetime.now():
-      upcoming_shows.append({
-        "artist_id": show.artist_id,
-        "artist_name": Artist.query.filter_by(id = show.artist_id).first().name,
-        "artist_image_link": Artist.query.filter_by(id = show.artist_id).first().image_link,
-        "start_time": format_datetime(str(show.start_time)) 
-      })
-    elif show.start_time < datetime.now():
-      past_shows.append({
-          "artist_id": show.artist_id,
-          "artist_name": Artist.query.filter_by(id = show.artist_id).first().name,
-          "artist_image_link": Artist.query.filter_by(id = show.artist_id).first().image_link,
-          "start_time": format_datetime(str(show.start_time)) 
-        })
-  # data is the object will store the data of the venue and it's shows
-  data = {
-    "id": venue.id,
-    "name": venue.name,
-    "genres": venue.genres,
-    "address": venue.address,
-    "city": venue.city,
-    "state": venue.state,
-    "phone": venue.phone,
-    "website": venue.website,
-    "facebook_link": venue.facebook_link,
-    "seeking_talent": venue.seeking_talent,
-    "seeking_description": venue.seeking_description,
-    "image_link": venue.image_link,
-    "past_shows": past_shows,
-    "past_shows_count": len(past_shows),
-    "upcoming_shows": upcoming_shows,
-    "upcoming_shows_count": len(upcoming_shows)
-  }
-  return render_template('pages/show_venue.html', venue=data)
+  # the venue with its past and upcoming shows
+  data = venue_details(venue_id)
+  return with_validators(render_template('pages/show_venue.html', venue=data), etag, last_modified)
 
 #  ----------------------------------------------------------------
 #  Create Venue
@@ -246,8 +983,7 @@ def create_venue_submission():
     city = form.city.data
     state = form.state.data
     address = form.address.data
-    phone = form.phone.data
-    phone_validation(phone)
+    phone = phone_validation(form.phone.data)
     genres = form.genres.data
     facebook_link = form.facebook_link.data
     website = form.website.data
@@ -261,8 +997,13 @@ def create_venue_submission():
                   seeking_talent = seeking_talent,seeking_description = seeking_description)
     # add new venue to session and commit to database
     db.session.add(venue)
+    # recommend it the artists seeking venues
+    db.session.flush()
+    refresh_venue_matches(venue)
     # commit the session
     db.session.commit()
+    # listing pages show this change, drop their cached copies
+    invalidate_pages()
     # on successful db insert, flash success
     flash('Venue ' + request.form['name'] + ' is successfully listed!')
   # incase of an error, flash and error
@@ -288,9 +1029,16 @@ def delete_venue(venue_id):
     venue = Venue.query.filter_by(id = venue_id).first()
     # store name of venue to display incase an error being flashed
     name = venue.name
-    # delete this object from databae
+    # artists losing shows with the venue, their counters are recounted below
+    artist_ids = db.session.query(Show.artist_id).filter_by(venue_id = venue.id).distinct()
+    artist_ids = [id for id, in artist_ids]
+    # delete this object from databae, the database deletes its shows
     db.session.delete(venue)
+    db.session.flush()
+    recount_show_counters(Artist, Artist.id.in_(artist_ids))
     db.session.commit()
+    # listing pages show this change, drop their cached copies
+    invalidate_pages()
     # when deleted successfully
     flash('Venue ' + name + ' was successfully deleted.')
 
@@ -307,12 +1055,18 @@ def delete_venue(venue_id):
 #  Artists
 #  ----------------------------------------------------------------
 @app.route('/artists')
+@cached_page
 def artists():
   # real data returned from querying the database
   data=[]
-  # retrieve all artists data from db
-  data = Artist.query.all()
-  return render_template('pages/artists.html', artists=data)
+  # retrieve all artists data from db, or only the ones of ?genre=Jazz
+  query = Artist.query
+  genre = request.args.get('genre')
+  if genre:
+    query = query.filter(has_genre(Artist, genre))
+  data = query.all()
+  # pass data to the template, with the number of listed artists of each genre
+  return render_template('pages/artists.html', artists=data, genres=genre_facets(Artist, genre=genre))
 
 @app.route('/artists/search', methods=['POST'])
 def search_artists():
@@ -321,8 +1075,8 @@ def search_artists():
   # search term entered by user
   search_term = request.form.get('search_term', '')
 
-  # find artists with partial string search, case-insensitive
-  artists = Artist.query.filter(Artist.name.ilike(f"%{search_term}%")).all()
+  # find artists with partial string search, case-insensitive, best matches first
+  artists = search_by_name(Artist, search_term, genre=request.form.get('genre'))
 
   # response stores all data result
   response = []
@@ -334,60 +1088,25 @@ def search_artists():
   }
 
   # iterating each artist and add it to the response object
-  for artist in artists:
+  for artist_id, name in artists:
      response["data"].append({
-       "id": artist.id,
-       "name": artist.name
+       "id": artist_id,
+       "name": name
     })
  
   return render_template('pages/search_artists.html', results=response, search_term=request.form.get('search_term', ''))
 
 @app.route('/artists/<int:artist_id>')
 def show_artist(artist_id):
-  # data members to store the data of upcoming and past shows
-  upcoming_shows = []
-  past_shows = []
-
-  # retrieve the artist data from database using id 
-  artist = Artist.query.filter_by(id = artist_id ).first()
-
-  # get all shows for this artist
-  shows = Show.query.filter_by(artist_id = artist_id).all()
-
-  # filter shows as past and upcoming shows
-  for show in shows:
-    if show.start_time > datetime.now():
-      upcoming_shows.append({
-        "venue_id": show.venue_id,
-        "venue_name": Venue.query.filter_by(id = show.venue_id).first().name,
-        "venue_image_link": Venue.query.filter_by(id = show.venue_id).first().image_link,
-        "start_time": format_datetime(str(show.start_time)) 
-      })
-    elif show.start_time < datetime.now():
-      past_shows.append({
-         "venue_id": show.venue_id,
-        "venue_name": Venue.query.filter_by(id = show.venue_id).first().name,
-        "venue_image_link": Venue.query.filter_by(id = show.venue_id).first().image_link,
-        "start_time": format_datetime(str(show.start_time)) 
-        })
-  # object to store the artist data along with list of upcoming and past shows
-  data = {
-    "id": artist.id,
-    "name": artist.name,
-    "genres": artist.genres,
-    "city": artist.city,
-    "state": artist.state,
-    "phone": artist.phone,
-    "website": artist.website,
-    "facebook_link": artist.facebook_link,
-    "seeking_venue": artist.seeking_venue,
-    "image_link": artist.image_link,
-    "past_shows": past_shows,
-    "past_shows_count": len(past_shows),
-    "upcoming_shows": upcoming_shows,
-    "upcoming_shows_count": len(upcoming_shows)
-  }
-  return render_template('pages/show_artist.html', artist=data)
+  # nothing to render when the client already has the current page
+  etag, last_modified = detail_validators(Artist, artist_id)
+  response = not_modified(etag, last_modified)
+  if response is not None:
+    return response
+
+  # the artist with its past and upcoming shows
+  data = artist_details(artist_id)
+  return with_validators(render_template('pages/show_artist.html', artist=data), etag, last_modified)
   # delete artist
 @app.route('/artists/<artist_id>', methods=['DELETE'])
 def delete_artist(artist_id):
@@ -396,9 +1115,16 @@ def delete_artist(artist_id):
     artist = Artist.query.filter_by(id = artist_id).first()
     # store name of artist to display incase an error being flashed
     name = artist.name
-    # delete this object from databae
+    # venues losing shows with the artist, their counters are recounted below
+    venue_ids = db.session.query(Show.venue_id).filter_by(artist_id = artist.id).distinct()
+    venue_ids = [id for id, in venue_ids]
+    # delete this object from databae, the database deletes its shows
     db.session.delete(artist)
+    db.session.flush()
+    recount_show_counters(Venue, Venue.id.in_(venue_ids))
     db.session.commit()
+    # listing pages show this change, drop their cached copies
+    invalidate_pages()
     # when deleted successfully
     flash('Artist ' + name + ' was successfully deleted.')
 
@@ -459,16 +1185,20 @@ def edit_artist_submission(artist_id):
     artist.name = form.name.data
     artist.city = form.city.data
     artist.state = form.state.data
-    artist.phone = form.phone.data
-    phone_validation(artist.phone)
+    artist.phone = phone_validation(form.phone.data)
     artist.facebook_link = form.facebook_link.data
     artist.image_link = form.image_link.data
     artist.website = form.website.data
     artist.seeking_venue = True if form.seeking_venue.data == 'Yes' else False
     artist.genres = form.genres.data
 
+    # update the venues it is recommended to
+    refresh_artist_matches(artist)
+
     # commit the changes
     db.session.commit()
+    # listing pages show this change, drop their cached copies
+    invalidate_pages()
 
     flash('Artist ' + request.form['name'] + ' was successfully updated!')
   except ValidationError as e:
@@ -532,16 +1262,20 @@ def edit_venue_submission(venue_id):
     venue.city = form.city.data
     venue.state = form.state.data
     venue.address = form.address.data
-    venue.phone = form.phone.data
-    phone_validation(venue.phone)
+    venue.phone = phone_validation(form.phone.data)
     venue.facebook_link = form.facebook_link.data
     venue.website = form.website.data
     venue.image_link = form.image_link.data
     venue.seeking_talent = True if form.seeking_talent.data == 'Yes' else False
     venue.seeking_description = form.seeking_description.data
 
+    # update the artists recommended to it
+    refresh_venue_matches(venue)
+
     # commit the changes
     db.session.commit()
+    # listing pages show this change, drop their cached copies
+    invalidate_pages()
 
     flash('Venue ' + request.form['name'] + ' was successfully updated!')
   except ValidationError as e:
@@ -575,8 +1309,7 @@ def create_artist_submission():
     name = form.name.data
     city = form.city.data
     state = form.state.data
-    phone = form.phone.data
-    phone_validation(phone)
+    phone = phone_validation(form.phone.data)
     genres = form.genres.data
     facebook_link = form.facebook_link.data
     website = form.website.data
@@ -590,7 +1323,12 @@ def create_artist_submission():
 
     # add new venue to session and commit to the database
     db.session.add(artist)
+    # recommend it to the venues seeking talent
+    db.session.flush()
+    refresh_artist_matches(artist)
     db.session.commit()
+    # listing pages show this change, drop their cached copies
+    invalidate_pages()
 
     # on successful db insert, flash success
     flash('Artist ' + request.form['name'] + ' was successfully listed!')
@@ -614,27 +1352,35 @@ def create_artist_submission():
 #  ----------------------------------------------------------------
 
 @app.route('/shows')
+@cached_page
 def shows():
-  # retrieve all shows from database
-  shows = Show.query.all()
+  # page size and cursor of the requested page, the first page has no cursor
+  per_page = request.args.get('per_page', SHOWS_PER_PAGE, type=int)
+  per_page = max(1, min(per_page, MAX_SHOWS_PER_PAGE))
+  cursor = request.args.get('after')
+  if cursor is not None:
+    cursor = decode_show_cursor(cursor)
+
+  # retrieve one page of shows joined with their venue and artist
+  rows, next_cursor = shows_page(cursor, per_page)
 
   data = []
-  # iterate the shows
-  for show in shows:
-    # get the venue hosting this show 
-    venue = Venue.query.filter_by(id = show.venue_id).first()
-    # get artist of this show data
-    artist = Artist.query.filter_by(id = show.artist_id).first()
-    # store all data into data object
+  # store all data into data object
+  for show_id, start_time, venue_id, venue_name, artist_id, artist_name, artist_image_link in rows:
     data.append({
-          "venue_id": show.venue_id,
-          "venue_name": venue.name,
-          "artist_id": show.artist_id,
-          "artist_name": artist.name,
-          "artist_image_link": artist.image_link,
-          "start_time": format_datetime(str(show.start_time))
+          "venue_id": venue_id,
+          "venue_name": venue_name,
+          "artist_id": artist_id,
+          "artist_name": artist_name,
+          "artist_image_link": artist_image_link,
+          "start_time": start_time
     })
-  return render_template('pages/shows.html', shows=data)
+
+  # link to the next page, if there is one
+  next_url = None
+  if next_cursor is not None:
+    next_url = url_for('shows', after=next_cursor, per_page=per_page)
+  return render_template('pages/shows.html', shows=data, next_url=next_url)
 
 @app.route('/shows/create')
 def create_shows():
@@ -656,9 +1402,13 @@ def create_show_submission():
     # create new show object with user input
     show = Show(artist_id = artist_id, venue_id = venue_id, start_time = start_time)
 
-    # add new show to session and commit it to the database
+    # add new show to session, count it for its venue and artist in the
+    # same transaction and commit it to the database
     db.session.add(show)
+    adjust_show_counters(show, 1)
     db.session.commit()
+    # listing pages show this change, drop their cached copies
+    invalidate_pages()
 
     # flash success when it's been committed
     flash('Show is successfully listed!')
@@ -674,6 +1424,320 @@ def create_show_submission():
 
   return render_template('pages/home.html')
 
+# show column values of a batch row, raises ValueError when the row is invalid
+def show_batch_values(row, with_id):
+  if not isinstance(row, dict):
+    raise ValueError('Row must be an object.')
+  values = {}
+  if with_id:
+    values['id'] = int(row['id'])
+  for column in ('artist_id', 'venue_id'):
+    if column in row:
+      values[column] = int(row[column])
+  if 'start_time' in row:
+    start_time = dateutil.parser.parse(row['start_time'])
+    # start times are stored naive, in local time like datetime.now()
+    if start_time.tzinfo is not None:
+      start_time = start_time.astimezone().replace(tzinfo=None)
+    values['start_time'] = start_time
+  return values
+
+# rows inserted per multi-row INSERT, well under the 65535 parameters
+# a Postgres statement takes
+SHOW_INSERT_CHUNK = 1000
+
+# inserts show rows and sets their ids: one multi-row INSERT ... RETURNING
+# per chunk on Postgres, one INSERT per row where RETURNING is unsupported
+def insert_show_rows(rows):
+  if db.engine.dialect.name != 'postgresql':
+    db.session.bulk_insert_mappings(Show, rows, return_defaults=True)
+    return
+  table = Show.__table__
+  for start in range(0, len(rows), SHOW_INSERT_CHUNK):
+    chunk = rows[start:start + SHOW_INSERT_CHUNK]
+    # RETURNING isn't promised to follow the VALUES order, so every row takes
+    # the id of a returned row with its values; rows with the same values are
+    # interchangeable
+    ids = defaultdict(list)
+    for id, artist_id, venue_id, start_time in db.session.execute(table.insert().values(chunk).returning(
+        table.c.id, table.c.artist_id, table.c.venue_id, table.c.start_time)):
+      ids[(artist_id, venue_id, start_time)].append(id)
+    for row in chunk:
+      row['id'] = ids[(row['artist_id'], row['venue_id'], row['start_time'])].pop()
+
+@app.route('/shows/batch', methods=['POST'])
+def show_batch_submission():
+  # {"insert": [{artist_id, venue_id, start_time}], "update": [{id, ...}], "delete": [id]}
+  body = request.get_json(silent=True)
+  if not isinstance(body, dict):
+    abort(400)
+  now = datetime.now()
+  updated_at = datetime.utcnow()
+
+  # validate every row first, the invalid ones are reported and skipped
+  results = []
+  inserts, updates, deletes = [], [], []
+  for op, rows, with_id in (('insert', inserts, False), ('update', updates, True), ('delete', deletes, True)):
+    if not isinstance(body.get(op, []), list):
+      abort(400)
+    for index, row in enumerate(body.get(op, [])):
+      result = {"op": op, "index": index, "success": True}
+      results.append(result)
+      try:
+        if op == 'delete':
+          values = {"id": int(row)}
+        else:
+          values = show_batch_values(row, with_id)
+          if op == 'insert' and set(values) != {'artist_id', 'venue_id', 'start_time'}:
+            raise ValueError('artist_id, venue_id and start_time are required.')
+          values['updated_at'] = updated_at
+        result["id"] = values.get('id')
+        rows.append((result, values))
+      except (KeyError, TypeError, ValueError, OverflowError) as e:
+        result.update(success=False, error=f'Invalid row: {e}')
+
+  # referenced venues, artists and shows must exist, three queries for the whole batch
+  show_ids = {values['id'] for result, values in updates + deletes}
+  shows = {show_id: (venue_id, artist_id) for show_id, venue_id, artist_id in
+           db.session.query(Show.id, Show.venue_id, Show.artist_id).filter(Show.id.in_(show_ids))}
+  venue_ids = {values['venue_id'] for result, values in inserts + updates if 'venue_id' in values}
+  venue_ids = {id for id, in db.session.query(Venue.id).filter(Venue.id.in_(venue_ids))}
+  artist_ids = {values['artist_id'] for result, values in inserts + updates if 'artist_id' in values}
+  artist_ids = {id for id, in db.session.query(Artist.id).filter(Artist.id.in_(artist_ids))}
+
+  def references_exist(result, values):
+    if 'id' in values and values['id'] not in shows:
+      error = f'Show {values["id"]} not found.'
+    elif 'venue_id' in values and values['venue_id'] not in venue_ids:
+      error = f'Venue {values["venue_id"]} not found.'
+    elif 'artist_id' in values and values['artist_id'] not in artist_ids:
+      error = f'Artist {values["artist_id"]} not found.'
+    else:
+      return True
+    result.update(success=False, error=error)
+    return False
+
+  inserts = [(result, values) for result, values in inserts if references_exist(result, values)]
+  updates = [(result, values) for result, values in updates if references_exist(result, values)]
+  deletes = [(result, values) for result, values in deletes if references_exist(result, values)]
+
+  # the venues and artists whose show counters change, before and after the batch
+  touched_venues = {shows[values['id']][0] for result, values in updates + deletes}
+  touched_artists = {shows[values['id']][1] for result, values in updates + deletes}
+  touched_venues |= {values['venue_id'] for result, values in inserts + updates if 'venue_id' in values}
+  touched_artists |= {values['artist_id'] for result, values in inserts + updates if 'artist_id' in values}
+
+  try:
+    # apply the valid rows in a single transaction
+    insert_show_rows([values for result, values in inserts])
+    db.session.bulk_update_mappings(Show, [values for result, values in updates])
+    if deletes:
+      Show.query.filter(Show.id.in_([values['id'] for result, values in deletes]))\
+        .delete(synchronize_session=False)
+    if touched_venues:
+      recount_show_counters(Venue, Venue.id.in_(touched_venues), now)
+    if touched_artists:
+      recount_show_counters(Artist, Artist.id.in_(touched_artists), now)
+    db.session.commit()
+    # listing pages show this change, drop their cached copies
+    invalidate_pages()
+    for result, values in inserts:
+      result["id"] = values['id']
+  except Exception:
+    db.session.rollback()
+    app.logger.exception('show batch failed')
+    for result, values in inserts + updates + deletes:
+      result.update(success=False, error='The batch could not be applied.')
+  finally:
+    db.session.close()
+
+  return jsonify({
+    "success": all(result["success"] for result in results),
+    "results": results
+  })
+
+#----------------------------------------------------------------------------#
+# API.
+#----------------------------------------------------------------------------#
+
+api = Blueprint('api', __name__, url_prefix='/api/v1')
+
+# rows fetched from the database, and items serialized, per streamed chunk
+API_STREAM_BATCH = 500
+
+# orjson when it is installed, the json module otherwise; both return bytes
+try:
+  import orjson
+
+  def json_dumps(value):
+    return orjson.dumps(value)
+except ImportError:
+  def json_default(value):
+    if isinstance(value, (date, datetime)):
+      return value.isoformat()
+    raise TypeError(f'{type(value).__name__} is not JSON serializable')
+
+  def json_dumps(value):
+    return json.dumps(value, default=json_default).encode('utf-8')
+
+def json_response(value, status=200):
+  return Response(json_dumps(value), status=status, mimetype='application/json')
+
+# streams items as a JSON array, serializing and sending them in chunks
+# so the whole collection is never held in memory
+def stream_json_array(items):
+  def generate():
+    yield b'['
+    chunk = []
+    first = True
+    for item in items:
+      chunk.append(json_dumps(item))
+      if len(chunk) >= API_STREAM_BATCH:
+        yield (b'' if first else b',') + b','.join(chunk)
+        first = False
+        chunk = []
+    if chunk:
+      yield (b'' if first else b',') + b','.join(chunk)
+    yield b']'
+  return Response(stream_with_context(generate()), mimetype='application/json')
+
+# rows of a query fetched in batches, from a server side cursor where supported
+def stream_rows(query):
+  return query.execution_options(stream_results=True).yield_per(API_STREAM_BATCH)
+
+# every show ordered by (start_time, id), walking shows_page one batch at a time
+def all_shows():
+  cursor = None
+  while True:
+    rows, next_cursor = shows_page(cursor, API_STREAM_BATCH)
+    yield from rows
+    if next_cursor is None:
+      return
+    cursor = (rows[-1].start_time, rows[-1].id)
+
+@api.route('/venues')
+def api_venues():
+  query = db.session.query(Venue.id, Venue.name, Venue.city, Venue.state,
+                           Venue.upcoming_shows_count, Venue.past_shows_count)\
+    .order_by(Venue.id)
+  return stream_json_array({
+    "id": venue_id,
+    "name": name,
+    "city": city,
+    "state": state,
+    "upcoming_shows_count": upcoming_shows_count,
+    "past_shows_count": past_shows_count
+  } for venue_id, name, city, state, upcoming_shows_count, past_shows_count in stream_rows(query))
+
+@api.route('/venues/<int:venue_id>')
+def api_venue(venue_id):
+  return json_response(venue_details(venue_id))
+
+@api.route('/venues/<int:venue_id>/matches')
+def api_venue_matches(venue_id):
+  limit = max(1, min(request.args.get('limit', 20, type=int), 100))
+  if db.session.query(Venue.id).filter_by(id = venue_id).first() is None:
+    abort(404)
+  return json_response([{
+    "artist_id": artist_id,
+    "name": name,
+    "genres": genres,
+    "city": city,
+    "state": state,
+    "score": score
+  } for artist_id, name, genres, city, state, score in venue_matches(venue_id, limit)])
+
+@api.route('/artists')
+def api_artists():
+  query = db.session.query(Artist.id, Artist.name, Artist.city, Artist.state,
+                           Artist.upcoming_shows_count, Artist.past_shows_count)\
+    .order_by(Artist.id)
+  return stream_json_array({
+    "id": artist_id,
+    "name": name,
+    "city": city,
+    "state": state,
+    "upcoming_shows_count": upcoming_shows_count,
+    "past_shows_count": past_shows_count
+  } for artist_id, name, city, state, upcoming_shows_count, past_shows_count in stream_rows(query))
+
+@api.route('/artists/<int:artist_id>')
+def api_artist(artist_id):
+  return json_response(artist_details(artist_id))
+
+@api.route('/shows')
+def api_shows():
+  return stream_json_array({
+    "id": show_id,
+    "start_time": start_time,
+    "venue_id": venue_id,
+    "venue_name": venue_name,
+    "artist_id": artist_id,
+    "artist_name": artist_name,
+    "artist_image_link": artist_image_link
+  } for show_id, start_time, venue_id, venue_name, artist_id, artist_name, artist_image_link in all_shows())
+
+@api.errorhandler(400)
+@api.errorhandler(404)
+def api_error(error):
+  return json_response({"error": error.code, "message": error.description}, error.code)
+
+app.register_blueprint(api)
+
+#----------------------------------------------------------------------------#
+# Query stats.
+#----------------------------------------------------------------------------#
+
+# times every statement and records it for the current request and for the
+# record_queries() blocks open in this thread; the start time is kept on the
+# statement's execution context, which is dropped with it even when it fails
+@event.listens_for(Engine, 'before_cursor_execute')
+def start_query_timer(conn, cursor, statement, parameters, context, executemany):
+  context._query_start = time.perf_counter()
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def record_query(conn, cursor, statement, parameters, context, executemany):
+  seconds = time.perf_counter() - context._query_start
+  stats = g.get('query_stats') if has_app_context() else None
+  if stats is not None:
+    stats.record(statement, seconds)
+  for recorder in active_recorders():
+    recorder.record(statement, seconds, parameters)
+
+@app.before_request
+def start_query_stats():
+  g.query_stats = QueryStats()
+
+# logs the statements of a request whose queries took too long
+def log_slow_request(stats, method, path):
+  db_ms = stats.seconds * 1000
+  if db_ms > app.config['SLOW_REQUEST_DB_MS']:
+    slowest = ' | '.join(f'{seconds * 1000:.1f}ms {" ".join(statement.split())}'
+                         for seconds, statement in stats.slowest_statements())
+    app.logger.warning(f'slow request {method} {path}: '
+                       f'{stats.count} queries in {db_ms:.1f}ms, slowest: {slowest}')
+
+@app.after_request
+def report_query_stats(response):
+  stats = g.get('query_stats')
+  if stats is None:
+    return response
+  if response.is_streamed:
+    # a streamed body queries the database as it is sent, after the headers;
+    # its statements are only known, and logged, once the response closes
+    method, path = request.method, request.full_path
+    response.call_on_close(lambda: log_slow_request(stats, method, path))
+    return response
+  response.headers['X-DB-Queries'] = str(stats.count)
+  response.headers['X-DB-Time'] = f'{stats.seconds * 1000:.1f}'
+  log_slow_request(stats, request.method, request.full_path)
+  return response
+
+@app.route('/metrics')
+def metrics():
+  return Response(render_metrics(pool_metrics.collect(db.engine.pool)),
+                  mimetype='text/plain; version=0.0.4')
+
 @app.errorhandler(404)
 def not_found_error(error):
     return render_template('errors/404.html'), 404
@@ -684,13 +1748,15 @@ def server_error(error):
 
 
 if not app.debug:
-    file_handler = FileHandler('error.log')
-    file_handler.setFormatter(
-        Formatter('%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]')
-    )
-    app.logger.setLevel(logging.INFO)
+    # records are queued on the request thread and written by a background thread
+    file_handler = file_handler_from_config(app.config)
     file_handler.setLevel(logging.INFO)
-    app.logger.addHandler(file_handler)
+    queue_handler, log_listener = queued_handler(file_handler)
+    app.logger.setLevel(logging.INFO)
+    app.logger.addHandler(queue_handler)
+    log_listener.start()
+    # flush the queued records on exit
+    atexit.register(log_listener.stop)
     app.logger.info('errors')
 
 #----------------------------------------------------------------------------#
@@ -0,0 +1,79 @@
+#----------------------------------------------------------------------------#
+# Page cache backends: rendered pages keyed by request path, expiring after
+# a TTL and cleared whenever the data they show is written.
+#----------------------------------------------------------------------------#
+
+import threading
+import time
+from collections import OrderedDict
+
+# in-process cache, evicts the least recently used pages above max_bytes
+class MemoryCache:
+  def __init__(self, ttl=60, max_bytes=32 * 1024 * 1024):
+    self.ttl = ttl
+    self.max_bytes = max_bytes
+    self.size = 0
+    self.pages = OrderedDict()
+    self.lock = threading.Lock()
+
+  def get(self, key):
+    with self.lock:
+      entry = self.pages.get(key)
+      if entry is None:
+        return None
+      expires, page, size = entry
+      if expires < time.monotonic():
+        self._remove(key)
+        return None
+      self.pages.move_to_end(key)
+      return page
+
+  def set(self, key, page):
+    with self.lock:
+      if key in self.pages:
+        self._remove(key)
+      # pages are counted by their UTF-8 size, as they are sent
+      size = len(page.encode('utf-8')) if isinstance(page, str) else len(page)
+      if size > self.max_bytes:
+        return
+      self.pages[key] = (time.monotonic() + self.ttl, page, size)
+      self.size += size
+      while self.size > self.max_bytes:
+        self._remove(next(iter(self.pages)))
+
+  def clear(self):
+    with self.lock:
+      self.pages.clear()
+      self.size = 0
+
+  def _remove(self, key):
+    expires, page, size = self.pages.pop(key)
+    self.size -= size
+
+# cache shared by all the app processes, needs the redis package;
+# the memory cap is left to the redis server's maxmemory/allkeys-lru policy
+class RedisCache:
+  def __init__(self, url, ttl=60, prefix='fyyur:page:'):
+    import redis
+    self.client = redis.Redis.from_url(url)
+    self.ttl = ttl
+    self.prefix = prefix
+
+  def get(self, key):
+    page = self.client.get(self.prefix + key)
+    return page.decode('utf-8') if page is not None else None
+
+  def set(self, key, page):
+    self.client.setex(self.prefix + key, self.ttl, page)
+
+  def clear(self):
+    keys = list(self.client.scan_iter(match=self.prefix + '*'))
+    if keys:
+      self.client.delete(*keys)
+
+# page cache selected by the PAGE_CACHE_* settings of the app config
+def page_cache_from_config(config):
+  ttl = config.get('PAGE_CACHE_TTL', 60)
+  if config.get('PAGE_CACHE_TYPE', 'memory') == 'redis':
+    return RedisCache(config['PAGE_CACHE_REDIS_URL'], ttl=ttl)
+  return MemoryCache(ttl=ttl, max_bytes=config.get('PAGE_CACHE_MAX_BYTES', 32 * 1024 * 1024))
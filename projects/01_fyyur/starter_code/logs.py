@@ -0,0 +1,51 @@
+#----------------------------------------------------------------------------#
+# Non-blocking file logging: records are put on a queue by the request
+# threads and written, with rotation, by a background listener thread.
+#----------------------------------------------------------------------------#
+
+import json
+import queue
+from datetime import datetime
+from logging import Formatter
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler, TimedRotatingFileHandler
+
+TEXT_FORMAT = '%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]'
+
+# one JSON object per line
+class JsonFormatter(Formatter):
+  def format(self, record):
+    entry = {
+      "time": datetime.fromtimestamp(record.created).isoformat(),
+      "level": record.levelname,
+      "logger": record.name,
+      "message": record.getMessage(),
+      "path": record.pathname,
+      "line": record.lineno
+    }
+    if record.exc_info:
+      entry["exception"] = self.formatException(record.exc_info)
+    return json.dumps(entry)
+
+# the handler writing to the log file, rotated by time when LOG_ROTATE_WHEN
+# is set (e.g. 'midnight') and by size otherwise
+def file_handler_from_config(config):
+  filename = config.get('LOG_FILE', 'error.log')
+  backups = config.get('LOG_BACKUP_COUNT', 5)
+  when = config.get('LOG_ROTATE_WHEN')
+  if when:
+    handler = TimedRotatingFileHandler(filename, when=when, backupCount=backups, delay=True)
+  else:
+    handler = RotatingFileHandler(filename, maxBytes=config.get('LOG_MAX_BYTES', 10 * 1024 * 1024),
+                                  backupCount=backups, delay=True)
+  if config.get('LOG_FORMAT', 'text') == 'json':
+    handler.setFormatter(JsonFormatter())
+  else:
+    handler.setFormatter(Formatter(TEXT_FORMAT))
+  return handler
+
+# (handler to add to loggers, listener to start) writing through file_handler;
+# the queue is unbounded so logging never blocks the caller
+def queued_handler(file_handler):
+  records = queue.Queue(-1)
+  listener = QueueListener(records, file_handler, respect_handler_level=True)
+  return QueueHandler(records), listener
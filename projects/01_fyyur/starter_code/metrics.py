@@ -0,0 +1,115 @@
+#----------------------------------------------------------------------------#
+# Connection pool instrumentation, reported by the /metrics endpoint.
+#----------------------------------------------------------------------------#
+
+import heapq
+import threading
+import time
+from contextlib import contextmanager
+from sqlalchemy.pool import QueuePool
+
+# time spent waiting for pooled connections, shared by all the app threads
+class PoolMetrics:
+  def __init__(self):
+    self.lock = threading.Lock()
+    self.checkouts = 0
+    self.checkout_seconds = 0.0
+    self.max_checkout_seconds = 0.0
+
+  def record_checkout(self, seconds):
+    with self.lock:
+      self.checkouts += 1
+      self.checkout_seconds += seconds
+      self.max_checkout_seconds = max(self.max_checkout_seconds, seconds)
+
+  # (name, help, value) of every metric of the pool
+  def collect(self, pool):
+    with self.lock:
+      metrics = [
+        ('fyyur_db_pool_checkouts_total', 'Connections checked out of the pool.', self.checkouts),
+        ('fyyur_db_pool_checkout_seconds_total', 'Time spent waiting for pooled connections.', self.checkout_seconds),
+        ('fyyur_db_pool_checkout_seconds_max', 'Longest wait for a pooled connection.', self.max_checkout_seconds),
+      ]
+    if isinstance(pool, QueuePool):
+      metrics += [
+        ('fyyur_db_pool_size', 'Connections kept open by the pool.', pool.size()),
+        ('fyyur_db_pool_checked_out', 'Connections currently in use.', pool.checkedout()),
+        ('fyyur_db_pool_overflow', 'Connections open beyond pool_size, negative while below it.', pool.overflow()),
+      ]
+    return metrics
+
+pool_metrics = PoolMetrics()
+
+# QueuePool timing every checkout, including the wait for a free connection
+class TimedQueuePool(QueuePool):
+  def _do_get(self):
+    start = time.perf_counter()
+    try:
+      return super()._do_get()
+    finally:
+      pool_metrics.record_checkout(time.perf_counter() - start)
+
+# metrics in the Prometheus text format
+def render_metrics(metrics):
+  lines = []
+  for name, help, value in metrics:
+    lines.append(f'# HELP {name} {help}')
+    lines.append(f'# TYPE {name} {"counter" if name.endswith("_total") else "gauge"}')
+    lines.append(f'{name} {value}')
+  return '\n'.join(lines) + '\n'
+
+#----------------------------------------------------------------------------#
+# SQL statements issued while serving a request, or inside record_queries().
+#----------------------------------------------------------------------------#
+
+class QueryStats:
+  # number of slowest statements kept
+  SLOWEST = 3
+
+  def __init__(self, keep_statements=False):
+    self.count = 0
+    self.seconds = 0.0
+    self.slowest = []
+    # (statement, parameters) of every statement, in order, when kept
+    self.statements = [] if keep_statements else None
+
+  def record(self, statement, seconds, parameters=None):
+    self.count += 1
+    self.seconds += seconds
+    if self.statements is not None:
+      self.statements.append((statement, parameters))
+    heapq.heappush(self.slowest, (seconds, statement))
+    if len(self.slowest) > self.SLOWEST:
+      heapq.heappop(self.slowest)
+
+  # (seconds, statement) of the slowest statements, slowest first
+  def slowest_statements(self):
+    return sorted(self.slowest, reverse=True)
+
+# QueryStats recording every statement of the current thread
+recorders = threading.local()
+
+def active_recorders():
+  if not hasattr(recorders, 'stack'):
+    recorders.stack = []
+  return recorders.stack
+
+@contextmanager
+def record_queries(keep_statements=False):
+  stats = QueryStats(keep_statements)
+  active_recorders().append(stats)
+  try:
+    yield stats
+  finally:
+    active_recorders().remove(stats)
+
+# fails when the block issues more than limit statements, e.g. in tests:
+#   with assert_max_queries(2):
+#     client.get('/venues/1')
+@contextmanager
+def assert_max_queries(limit):
+  with record_queries() as stats:
+    yield stats
+  if stats.count > limit:
+    statements = '\n'.join(statement for seconds, statement in stats.slowest_statements())
+    raise AssertionError(f'{stats.count} queries issued, at most {limit} expected. Slowest:\n{statements}')
@@ -0,0 +1,26 @@
+"""GIN indexes on venue and artist genres
+
+Revision ID: 0b7e5d3a9c64
+Revises: f58a0b6d2e19
+Create Date: 2020-06-18 14:06:51.372940
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0b7e5d3a9c64'
+down_revision = 'f58a0b6d2e19'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_venue_genres', 'venue', ['genres'], unique=False, postgresql_using='gin')
+    op.create_index('ix_artist_genres', 'artist', ['genres'], unique=False, postgresql_using='gin')
+
+
+def downgrade():
+    op.drop_index('ix_artist_genres', table_name='artist')
+    op.drop_index('ix_venue_genres', table_name='venue')
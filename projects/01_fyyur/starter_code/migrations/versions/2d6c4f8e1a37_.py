@@ -0,0 +1,46 @@
+"""precomputed venue and artist matches
+
+Revision ID: 2d6c4f8e1a37
+Revises: 0b7e5d3a9c64
+Create Date: 2020-06-21 17:45:22.093816
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '2d6c4f8e1a37'
+down_revision = '0b7e5d3a9c64'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('match',
+    sa.Column('venue_id', sa.Integer(), nullable=False),
+    sa.Column('artist_id', sa.Integer(), nullable=False),
+    sa.Column('score', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['artist_id'], ['artist.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['venue_id'], ['venue.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('venue_id', 'artist_id')
+    )
+    op.create_index('ix_match_venue_id_score', 'match', ['venue_id', 'score'], unique=False)
+    op.create_index('ix_match_artist_id', 'match', ['artist_id'], unique=False)
+
+    # backfill with the same scoring as match_score() in app.py
+    op.execute('''
+        INSERT INTO match (venue_id, artist_id, score)
+        SELECT venue.id, artist.id,
+               2 * cardinality(ARRAY(SELECT unnest(venue.genres) INTERSECT SELECT unnest(artist.genres)))
+               + CASE WHEN venue.state = artist.state THEN 1 ELSE 0 END
+               + CASE WHEN venue.state = artist.state AND venue.city = artist.city THEN 2 ELSE 0 END
+        FROM venue JOIN artist ON venue.genres && artist.genres OR venue.state = artist.state
+        WHERE venue.seeking_talent AND artist.seeking_venue
+    ''')
+
+
+def downgrade():
+    op.drop_index('ix_match_artist_id', table_name='match')
+    op.drop_index('ix_match_venue_id_score', table_name='match')
+    op.drop_table('match')
@@ -0,0 +1,26 @@
+"""indexes on venue and artist state
+
+Revision ID: 7a1c3e5b9d20
+Revises: 2d6c4f8e1a37
+Create Date: 2020-06-22 10:12:47.310582
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7a1c3e5b9d20'
+down_revision = '2d6c4f8e1a37'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_venue_state', 'venue', ['state'], unique=False)
+    op.create_index('ix_artist_state', 'artist', ['state'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_artist_state', table_name='artist')
+    op.drop_index('ix_venue_state', table_name='venue')
@@ -0,0 +1,42 @@
+"""upcoming and past show counters on venue and artist
+
+Revision ID: 8d4f1b6a2c70
+Revises: 5c2e8a41f9d3
+Create Date: 2020-06-04 20:12:47.531092
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8d4f1b6a2c70'
+down_revision = '5c2e8a41f9d3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    for table in ('venue', 'artist'):
+        op.add_column(table, sa.Column('upcoming_shows_count', sa.Integer(), server_default='0', nullable=False))
+        op.add_column(table, sa.Column('past_shows_count', sa.Integer(), server_default='0', nullable=False))
+        op.add_column(table, sa.Column('show_counts_at', sa.DateTime(), server_default=sa.func.now(), nullable=False))
+
+    # backfill the counters from the existing shows
+    op.execute('''
+        UPDATE venue SET
+            upcoming_shows_count = (SELECT count(*) FROM show WHERE show.venue_id = venue.id AND show.start_time > venue.show_counts_at),
+            past_shows_count = (SELECT count(*) FROM show WHERE show.venue_id = venue.id AND show.start_time <= venue.show_counts_at)
+    ''')
+    op.execute('''
+        UPDATE artist SET
+            upcoming_shows_count = (SELECT count(*) FROM show WHERE show.artist_id = artist.id AND show.start_time > artist.show_counts_at),
+            past_shows_count = (SELECT count(*) FROM show WHERE show.artist_id = artist.id AND show.start_time <= artist.show_counts_at)
+    ''')
+
+
+def downgrade():
+    for table in ('artist', 'venue'):
+        op.drop_column(table, 'show_counts_at')
+        op.drop_column(table, 'past_shows_count')
+        op.drop_column(table, 'upcoming_shows_count')
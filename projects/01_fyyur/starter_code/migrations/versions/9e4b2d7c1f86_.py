@@ -0,0 +1,24 @@
+"""index on show (start_time, id)
+
+Revision ID: 9e4b2d7c1f86
+Revises: 7a1c3e5b9d20
+Create Date: 2020-06-22 11:40:05.518244
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9e4b2d7c1f86'
+down_revision = '7a1c3e5b9d20'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_show_start_time_id', 'show', ['start_time', 'id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_show_start_time_id', table_name='show')
@@ -0,0 +1,26 @@
+"""indexes on show (venue_id, start_time) and (artist_id, start_time)
+
+Revision ID: a3e7c9125b48
+Revises: 8d4f1b6a2c70
+Create Date: 2020-06-06 11:03:29.864120
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a3e7c9125b48'
+down_revision = '8d4f1b6a2c70'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_show_venue_id_start_time', 'show', ['venue_id', 'start_time'], unique=False)
+    op.create_index('ix_show_artist_id_start_time', 'show', ['artist_id', 'start_time'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_show_artist_id_start_time', table_name='show')
+    op.drop_index('ix_show_venue_id_start_time', table_name='show')
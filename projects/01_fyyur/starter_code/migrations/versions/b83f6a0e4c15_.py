@@ -0,0 +1,29 @@
+"""updated_at in UTC
+
+Revision ID: b83f6a0e4c15
+Revises: 9e4b2d7c1f86
+Create Date: 2020-06-22 14:26:51.027394
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b83f6a0e4c15'
+down_revision = '9e4b2d7c1f86'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    for table in ('venue', 'artist', 'show'):
+        # existing values are local times of the database's time zone
+        op.execute(f"UPDATE {table} SET updated_at = timezone('utc', timezone(current_setting('TimeZone'), updated_at))")
+        op.alter_column(table, 'updated_at', server_default=sa.text("timezone('utc', now())"))
+
+
+def downgrade():
+    for table in ('venue', 'artist', 'show'):
+        op.alter_column(table, 'updated_at', server_default=sa.func.now())
+        op.execute(f"UPDATE {table} SET updated_at = timezone(current_setting('TimeZone'), timezone('utc', updated_at))")
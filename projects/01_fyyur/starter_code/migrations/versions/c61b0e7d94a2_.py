@@ -0,0 +1,28 @@
+"""updated_at on venue, artist and show
+
+Revision ID: c61b0e7d94a2
+Revises: a3e7c9125b48
+Create Date: 2020-06-09 16:27:05.118374
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c61b0e7d94a2'
+down_revision = 'a3e7c9125b48'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('venue', sa.Column('updated_at', sa.DateTime(), server_default=sa.func.now(), nullable=False))
+    op.add_column('artist', sa.Column('updated_at', sa.DateTime(), server_default=sa.func.now(), nullable=False))
+    op.add_column('show', sa.Column('updated_at', sa.DateTime(), server_default=sa.func.now(), nullable=False))
+
+
+def downgrade():
+    op.drop_column('show', 'updated_at')
+    op.drop_column('artist', 'updated_at')
+    op.drop_column('venue', 'updated_at')
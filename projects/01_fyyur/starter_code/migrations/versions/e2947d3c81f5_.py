@@ -0,0 +1,30 @@
+"""cascade show deletes from venue and artist
+
+Revision ID: e2947d3c81f5
+Revises: c61b0e7d94a2
+Create Date: 2020-06-13 10:52:38.640217
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e2947d3c81f5'
+down_revision = 'c61b0e7d94a2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.drop_constraint('show_artist_id_fkey', 'show', type_='foreignkey')
+    op.drop_constraint('show_venue_id_fkey', 'show', type_='foreignkey')
+    op.create_foreign_key('show_artist_id_fkey', 'show', 'artist', ['artist_id'], ['id'], ondelete='CASCADE')
+    op.create_foreign_key('show_venue_id_fkey', 'show', 'venue', ['venue_id'], ['id'], ondelete='CASCADE')
+
+
+def downgrade():
+    op.drop_constraint('show_venue_id_fkey', 'show', type_='foreignkey')
+    op.drop_constraint('show_artist_id_fkey', 'show', type_='foreignkey')
+    op.create_foreign_key('show_venue_id_fkey', 'show', 'venue', ['venue_id'], ['id'])
+    op.create_foreign_key('show_artist_id_fkey', 'show', 'artist', ['artist_id'], ['id'])
@@ -0,0 +1,38 @@
+"""show counters as of the app's clock
+
+Revision ID: e5a9c2f7b318
+Revises: b83f6a0e4c15
+Create Date: 2020-06-23 10:41:09.683215
+
+"""
+from datetime import datetime
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e5a9c2f7b318'
+down_revision = 'b83f6a0e4c15'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # show_counts_at was backfilled with the database's now(), in the time zone
+    # of its session, while start times are compared with the app's local
+    # datetime.now(); recount the shows as of the app's clock, which sets
+    # show_counts_at from now on
+    now = datetime.now().isoformat(sep=' ')
+    for table, key in (('venue', 'venue_id'), ('artist', 'artist_id')):
+        op.execute(sa.text(f'''
+            UPDATE {table} SET
+                upcoming_shows_count = (SELECT count(*) FROM show WHERE show.{key} = {table}.id AND show.start_time > CAST(:now AS TIMESTAMP)),
+                past_shows_count = (SELECT count(*) FROM show WHERE show.{key} = {table}.id AND show.start_time <= CAST(:now AS TIMESTAMP)),
+                show_counts_at = CAST(:now AS TIMESTAMP)
+        ''').bindparams(now=now))
+        op.alter_column(table, 'show_counts_at', server_default=None)
+
+
+def downgrade():
+    for table in ('artist', 'venue'):
+        op.alter_column(table, 'show_counts_at', server_default=sa.func.now())
@@ -0,0 +1,42 @@
+"""area table referenced by venue
+
+Revision ID: f58a0b6d2e19
+Revises: e2947d3c81f5
+Create Date: 2020-06-15 19:34:10.907251
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f58a0b6d2e19'
+down_revision = 'e2947d3c81f5'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('area',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('city', sa.String(length=120), nullable=False),
+    sa.Column('state', sa.String(length=120), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('state', 'city')
+    )
+    op.add_column('venue', sa.Column('area_id', sa.Integer(), nullable=True))
+
+    # backfill one area per distinct (city, state) of the existing venues
+    op.execute('INSERT INTO area (city, state) SELECT DISTINCT city, state FROM venue')
+    op.execute('UPDATE venue SET area_id = area.id FROM area WHERE area.city = venue.city AND area.state = venue.state')
+
+    op.alter_column('venue', 'area_id', existing_type=sa.Integer(), nullable=False)
+    op.create_index(op.f('ix_venue_area_id'), 'venue', ['area_id'], unique=False)
+    op.create_foreign_key('venue_area_id_fkey', 'venue', 'area', ['area_id'], ['id'])
+
+
+def downgrade():
+    op.drop_constraint('venue_area_id_fkey', 'venue', type_='foreignkey')
+    op.drop_index(op.f('ix_venue_area_id'), table_name='venue')
+    op.drop_column('venue', 'area_id')
+    op.drop_table('area')
@@ -0,0 +1,80 @@
+#----------------------------------------------------------------------------#
+# In-process trigram index, used for name search when the database is not
+# Postgres (and pg_trgm is not available), e.g. SQLite in tests.
+#----------------------------------------------------------------------------#
+
+import re
+import threading
+from collections import defaultdict
+
+# all 3 character substrings of a lowercased text, used to find candidates
+# for a case-insensitive substring match
+def substring_trigrams(text):
+  text = text.lower()
+  return {text[i:i + 3] for i in range(len(text) - 2)}
+
+# pg_trgm style trigrams: every word is padded with two spaces in front and
+# one behind, used to rank the matches
+def word_trigrams(text):
+  grams = set()
+  for word in re.findall(r'\w+', text.lower()):
+    word = f'  {word} '
+    grams.update(word[i:i + 3] for i in range(len(word) - 2))
+  return grams
+
+# same measure as pg_trgm similarity(): shared trigrams over all trigrams
+def similarity(a, b):
+  a = word_trigrams(a)
+  b = word_trigrams(b)
+  if not a or not b:
+    return 0.0
+  return len(a & b) / len(a | b)
+
+class NgramIndex:
+  def __init__(self):
+    self.lock = threading.Lock()
+    self.texts = {}
+    self.postings = {}
+    # set when the indexed table changed, the owner rebuilds the index lazily
+    self.stale = True
+    # bumped by every invalidation, tells a rebuild whether it missed one
+    self.version = 0
+
+  # builds the index aside and swaps it in, searches running meanwhile keep
+  # using the previous one
+  def rebuild(self, rows):
+    with self.lock:
+      version = self.version
+    texts = {}
+    postings = defaultdict(set)
+    for id, text in rows:
+      texts[id] = text
+      for gram in substring_trigrams(text):
+        postings[gram].add(id)
+    with self.lock:
+      self.texts = texts
+      self.postings = postings
+      # rows read before an invalidation made during the build may be outdated
+      self.stale = self.version != version
+
+  def invalidate(self):
+    with self.lock:
+      self.version += 1
+      self.stale = True
+
+  # (id, text) of the texts containing term, best similarity first
+  def search(self, term, limit):
+    with self.lock:
+      texts, postings = self.texts, self.postings
+    grams = substring_trigrams(term)
+    if grams:
+      # only texts having every trigram of the term can contain it
+      candidates = set.intersection(*(postings.get(gram, set()) for gram in grams))
+    else:
+      # terms shorter than a trigram can't use the index
+      candidates = texts.keys()
+
+    term = term.lower()
+    matches = [(id, texts[id]) for id in candidates if term in texts[id].lower()]
+    matches.sort(key=lambda match: (-similarity(match[1], term), match[0]))
+    return matches[:limit]
@@ -0,0 +1,101 @@
+'''
+Benchmarks
+
+Run them against a scratch database, they insert their own questions and
+delete them again when they are done:
+
+  $ createdb trivia_bench && psql trivia_bench < trivia.psql
+  $ export DATABASE_PATH=postgres://localhost:5432/trivia_bench
+  $ python benchmarks.py search
+'''
+import os
+import sys
+import time
+
+from flaskr import create_app, search_questions
+from models import setup_db, db, Question, question_index
+from search import tokenize
+
+# every question created by a benchmark has this answer
+BENCH_ANSWER = 'bench-answer'
+
+# vocabulary of the seeded questions, drawn with a skew towards the first
+# words so the terms range from very common to rare
+WORDS = sorted({word for text in [
+  "Whose autobiography is entitled 'I Know Why the Caged Bird Sings'?",
+  "What boxer's original name is Cassius Clay?",
+  "What movie earned Tom Hanks his third straight Oscar nomination, in 1996?",
+  "What was the title of the 1990 fantasy directed by Tim Burton about a young man with multi-bladed appendages?",
+  "Which is the only team to play in every soccer World Cup tournament?",
+  "In which royal palace would you find the Hall of Mirrors?",
+  "Which Dutch graphic artist was a creator of optical illusions?",
+  "How many paintings did Van Gogh sell in his lifetime?",
+  "Which American artist was a pioneer of Abstract Expressionism?",
+  "What is the heaviest organ in the human body?",
+  "Hematology is a branch of medicine involving the study of what?",
+  "Which dung beetle was worshipped by the ancient Egyptians?",
+] for word in tokenize(text)})
+
+def timed(func, repeat=5):
+  '''best wall time of func() in milliseconds'''
+  best = None
+  for _ in range(repeat):
+    start = time.perf_counter()
+    func()
+    elapsed = (time.perf_counter() - start) * 1000
+    best = elapsed if best is None else min(best, elapsed)
+  return best
+
+def seed(questions):
+  '''questions of 6 to 15 random words, in one INSERT ... SELECT'''
+  db.session.execute('''
+    INSERT INTO questions (question, answer, difficulty, category)
+    SELECT (SELECT string_agg(words[1 + floor(power(random(), 3) * array_length(words, 1))::int], ' ')
+            FROM generate_series(1, 6 + i % 10)),
+           :answer, 1 + i % 5, 1 + i % 6
+    FROM generate_series(1, :questions) AS i, (SELECT CAST(:words AS text[]) AS words) AS vocabulary
+  ''', {'answer': BENCH_ANSWER, 'questions': questions, 'words': WORDS})
+  db.session.execute('''
+    CREATE INDEX IF NOT EXISTS ix_questions_search ON questions
+    USING gin (to_tsvector('english', coalesce(question, '')))
+  ''')
+  db.session.commit()
+  db.session.execute('ANALYZE questions')
+
+def cleanup():
+  Question.query.filter_by(answer=BENCH_ANSWER).delete(synchronize_session=False)
+  db.session.commit()
+
+def ilike(term):
+  '''the substring search the endpoint was specified with'''
+  matches = Question.query.filter(Question.question.ilike(f'%{term}%'))
+  return matches.count(), matches.order_by(Question.id).limit(10).all()
+
+def bench_search(questions=1000000, terms=(WORDS[0], WORDS[len(WORDS) // 2], WORDS[-1], ' '.join(WORDS[:2]))):
+  try:
+    seed(questions)
+    rows = db.session.query(Question.id, Question.question).all()
+    build_ms = timed(lambda: question_index.rebuild(rows), repeat=1)
+    print(f'{questions} questions, in-process index built in {build_ms:.0f} ms')
+
+    print(f'{"term":>24} {"matches":>8} {"ILIKE ms":>9} {"tsvector ms":>12} {"index ms":>9}')
+    for term in terms:
+      total, _ = search_questions(term, 1)
+      ilike_ms = timed(lambda: ilike(term))
+      tsvector_ms = timed(lambda: search_questions(term, 1))
+      index_ms = timed(lambda: question_index.search(term, 10))
+      print(f'{term:>24} {total:>8} {ilike_ms:>9.1f} {tsvector_ms:>12.1f} {index_ms:>9.1f}')
+  finally:
+    cleanup()
+
+BENCHMARKS = {
+  'search': bench_search,
+}
+
+if __name__ == '__main__':
+  names = sys.argv[1:] or list(BENCHMARKS)
+  app = create_app()
+  setup_db(app, os.environ.get('DATABASE_PATH', 'postgres://localhost:5432/trivia_bench'))
+  with app.app_context():
+    for name in names:
+      BENCHMARKS[name]()
@@ -1,103 +1,376 @@
 import os
-from flask import Flask, request, abort, jsonify
+import base64
+import binascii
+from flask import Flask, request, abort, jsonify, current_app
 from flask_sqlalchemy import SQLAlchemy
 from flask_cors import CORS
+from sqlalchemy import func
 import random
 
-from models import setup_db, Question, Category
+from models import setup_db, db, Question, Category, question_counts, question_pool, question_index
+from .quiz import QuizSessions
 
 QUESTIONS_PER_PAGE = 10
+# seconds a quiz session is kept after its last question
+QUIZ_SESSION_TTL = 3600
+
+'''
+Question cursors
+    opaque tokens for the id of the last question of a page; the next page
+    starts after it through the primary key instead of skipping an OFFSET
+'''
+def encode_cursor(question_id):
+  return base64.urlsafe_b64encode(str(question_id).encode()).decode().rstrip('=')
+
+def decode_cursor(cursor):
+  try:
+    padding = '=' * (-len(cursor) % 4)
+    return int(base64.urlsafe_b64decode(cursor + padding).decode())
+  except (binascii.Error, UnicodeDecodeError, ValueError):
+    abort(400)
+
+'''
+paginate_questions(query)
+    a page of the questions of query, ordered by id, and the cursor of the
+    next one (None on the last page); ?cursor= seeks, ?page= is kept for
+    clients numbering pages
+'''
+def paginate_questions(query):
+  query = query.order_by(Question.id)
+  cursor = request.args.get('cursor')
+  if cursor is not None:
+    query = query.filter(Question.id > decode_cursor(cursor))
+  else:
+    page = request.args.get('page', 1, type=int)
+    if page < 1:
+      abort(400)
+    query = query.offset((page - 1) * QUESTIONS_PER_PAGE)
+
+  # one extra row tells whether there is a next page
+  questions = query.limit(QUESTIONS_PER_PAGE + 1).all()
+  next_cursor = None
+  if len(questions) > QUESTIONS_PER_PAGE:
+    questions = questions[:QUESTIONS_PER_PAGE]
+    next_cursor = encode_cursor(questions[-1].id)
+  return questions, next_cursor
+
+'''
+random_question(category, excluded)
+    a random question of the category (None for any) whose id is not
+    excluded, from the in-memory pool; while the pool is cold it is warmed in
+    the background and the question is picked at a random offset in SQL
+'''
+def random_question(category, excluded):
+  excluded = set(excluded)
+  # a picked id may have just been deleted, try another one
+  for _ in range(3):
+    try:
+      question_id = question_pool.pick(category, excluded)
+    except LookupError:
+      question_pool.warm(current_app._get_current_object())
+      return random_question_from_db(category, excluded)
+    if question_id is None:
+      return None
+    question = Question.query.get(question_id)
+    if question is not None:
+      return question
+    excluded.add(question_id)
+  return random_question_from_db(category, excluded)
+
+def random_question_from_db(category, excluded):
+  query = Question.query
+  if category is None:
+    count = question_counts.total()
+  else:
+    query = query.filter(Question.category == category)
+    count = question_counts.category(category)
+  if excluded:
+    query = query.filter(~Question.id.in_(excluded))
+
+  # excluded ids are not all of this category, this may undercount the
+  # questions left and just narrow the offsets drawn from
+  remaining = count - len(excluded)
+  offset = random.randrange(remaining) if remaining > 0 else 0
+  question = query.order_by(Question.id).offset(offset).first()
+  if question is None and offset:
+    question = query.order_by(Question.id).first()
+  return question
+
+def category_question_ids(category):
+  try:
+    return question_pool.category_ids(category)
+  except LookupError:
+    question_pool.warm(current_app._get_current_object())
+  query = Question.query.with_entities(Question.id)
+  if category is not None:
+    query = query.filter(Question.category == category)
+  return [id for id, in query]
+
+'''
+search_questions(term, page)
+    (number of matches, the questions of the page), best match first: through
+    the ix_questions_search GIN index on Postgres, the in-process inverted
+    index elsewhere
+'''
+def search_questions(term, page):
+  offset = (page - 1) * QUESTIONS_PER_PAGE
+  if db.engine.dialect.name == 'postgresql':
+    document = Question.search_document()
+    tsquery = func.plainto_tsquery('english', term)
+    matches = Question.query.filter(document.op('@@')(tsquery))
+    questions = matches\
+      .order_by(func.ts_rank(document, tsquery).desc(), Question.id)\
+      .offset(offset)\
+      .limit(QUESTIONS_PER_PAGE)\
+      .all()
+    return matches.count(), questions
+
+  if question_index.stale:
+    question_index.rebuild(db.session.query(Question.id, Question.question))
+  total, ids = question_index.search(term, QUESTIONS_PER_PAGE, offset)
+  questions = {question.id: question for question in Question.query.filter(Question.id.in_(ids))}
+  return total, [questions[id] for id in ids if id in questions]
+
+def all_categories():
+  return {category.id: category.type for category in Category.query.order_by(Category.id).all()}
 
 def create_app(test_config=None):
   # create and configure the app
   app = Flask(__name__)
   setup_db(app)
+  quiz_sessions = QuizSessions(ttl=QUIZ_SESSION_TTL)
   
-  '''
-  @TODO: Set up CORS. Allow '*' for origins. Delete the sample route after completing the TODOs
-  '''
+  CORS(app, resources={r'/*': {'origins': '*'}})
+
+  @app.after_request
+  def after_request(response):
+    response.headers.add('Access-Control-Allow-Headers', 'Content-Type,Authorization')
+    response.headers.add('Access-Control-Allow-Methods', 'GET,POST,PATCH,DELETE,OPTIONS')
+    return response
+
+  @app.route('/categories')
+  def get_categories():
+    return jsonify({
+      'success': True,
+      'categories': all_categories()
+    })
 
   '''
-  @TODO: Use the after_request decorator to set Access-Control-Allow
+  GET /questions?cursor=<next_cursor> or ?page=<n>
+      a page of questions; total_questions comes from the cached counts
+      instead of a COUNT(*) per request
   '''
+  @app.route('/questions')
+  def get_questions():
+    questions, next_cursor = paginate_questions(Question.query)
+    if not questions and request.args.get('page', 1, type=int) > 1:
+      abort(404)
+
+    return jsonify({
+      'success': True,
+      'questions': [question.format() for question in questions],
+      'total_questions': question_counts.total(),
+      'next_cursor': next_cursor,
+      'categories': all_categories(),
+      'current_category': None
+    })
+
+  @app.route('/questions/<int:question_id>', methods=['DELETE'])
+  def delete_question(question_id):
+    question = Question.query.get(question_id)
+    if question is None:
+      abort(404)
+    question.delete()
+
+    return jsonify({
+      'success': True,
+      'deleted': question_id,
+      'total_questions': question_counts.total()
+    })
 
   '''
-  @TODO: 
-  Create an endpoint to handle GET requests 
-  for all available categories.
+  POST /questions
+      {"searchTerm": "...", "page": n} searches the questions by their words,
+      best match first; {"question", "answer", "category", "difficulty"}
+      creates one
   '''
+  @app.route('/questions', methods=['POST'])
+  def create_or_search_questions():
+    body = request.get_json(silent=True) or {}
+    if 'searchTerm' in body:
+      return search(body)
 
+    try:
+      question = Question(
+        question=body['question'],
+        answer=body['answer'],
+        category=int(body['category']),
+        difficulty=int(body['difficulty'])
+      )
+    except (KeyError, TypeError, ValueError):
+      abort(422)
+    if not question.question or not question.answer:
+      abort(422)
+    # the foreign key would refuse it at commit
+    if Category.query.get(question.category) is None:
+      abort(422)
+    question.insert()
+
+    return jsonify({
+      'success': True,
+      'created': question.id,
+      'total_questions': question_counts.total()
+    }), 201
+
+  def search(body):
+    term = body.get('searchTerm')
+    page = body.get('page', request.args.get('page', 1, type=int))
+    if not isinstance(term, str) or not isinstance(page, int) or page < 1:
+      abort(400)
+
+    total, questions = search_questions(term, page)
+    return jsonify({
+      'success': True,
+      'questions': [question.format() for question in questions],
+      'total_questions': total,
+      'current_category': None
+    })
 
   '''
-  @TODO: 
-  Create an endpoint to handle GET requests for questions, 
-  including pagination (every 10 questions). 
-  This endpoint should return a list of questions, 
-  number of total questions, current category, categories. 
-
-  TEST: At this point, when you start the application
-  you should see questions and categories generated,
-  ten questions per page and pagination at the bottom of the screen for three pages.
-  Clicking on the page numbers should update the questions. 
+  GET /categories/<category_id>/questions?cursor=<next_cursor> or ?page=<n>
+      a page of the questions of a category, read through the
+      ix_questions_category index
   '''
+  @app.route('/categories/<int:category_id>/questions')
+  def get_category_questions(category_id):
+    category = Category.query.get(category_id)
+    if category is None:
+      abort(404)
 
-  '''
-  @TODO: 
-  Create an endpoint to DELETE question using a question ID. 
+    questions, next_cursor = paginate_questions(Question.query.filter(Question.category == category_id))
+    if not questions and request.args.get('page', 1, type=int) > 1:
+      abort(404)
 
-  TEST: When you click the trash icon next to a question, the question will be removed.
-  This removal will persist in the database and when you refresh the page. 
-  '''
+    return jsonify({
+      'success': True,
+      'questions': [question.format() for question in questions],
+      'total_questions': question_counts.category(category_id),
+      'next_cursor': next_cursor,
+      'current_category': category.format()
+    })
 
-  '''
-  @TODO: 
-  Create an endpoint to POST a new question, 
-  which will require the question and answer text, 
-  category, and difficulty score.
 
-  TEST: When you submit a question on the "Add" tab, 
-  the form will clear and the question will appear at the end of the last page
-  of the questions list in the "List" tab.  
   '''
-
+  POST /quizzes
+      {"previous_questions": [ids], "quiz_category": {"id": 0 for all, "type"}}
+      a random question not asked yet, question is null when there is none left
   '''
-  @TODO: 
-  Create a POST endpoint to get questions based on a search term. 
-  It should return any questions for whom the search term 
-  is a substring of the question. 
+  @app.route('/quizzes', methods=['POST'])
+  def play_quiz():
+    body = request.get_json(silent=True) or {}
+    previous_questions = body.get('previous_questions', [])
+    quiz_category = body.get('quiz_category') or {}
+    if not isinstance(previous_questions, list) or not isinstance(quiz_category, dict):
+      abort(400)
+    try:
+      excluded = [int(id) for id in previous_questions]
+      category = int(quiz_category.get('id', 0)) or None
+    except (TypeError, ValueError):
+      abort(400)
 
-  TEST: Search by any phrase. The questions list will update to include 
-  only question that include that string within their question. 
-  Try using the word "title" to start. 
-  '''
+    question = random_question(category, excluded)
+    return jsonify({
+      'success': True,
+      'question': question.format() if question is not None else None
+    })
 
   '''
-  @TODO: 
-  Create a GET endpoint to get questions based on category. 
-
-  TEST: In the "List" tab / main screen, clicking on one of the 
-  categories in the left column will cause only questions of that 
-  category to be shown. 
+  POST /quizzes/sessions
+      {"quiz_category": {"id": 0 for all, "type"}}
+      starts a quiz, the questions left are kept server-side; returns its
+      session_id and total_questions
   '''
+  @app.route('/quizzes/sessions', methods=['POST'])
+  def create_quiz_session():
+    body = request.get_json(silent=True) or {}
+    quiz_category = body.get('quiz_category') or {}
+    if not isinstance(quiz_category, dict):
+      abort(400)
+    try:
+      category = int(quiz_category.get('id', 0)) or None
+    except (TypeError, ValueError):
+      abort(400)
+    if category is not None and Category.query.get(category) is None:
+      abort(404)
 
+    session_id, total = quiz_sessions.create(category_question_ids(category))
+    return jsonify({
+      'success': True,
+      'session_id': session_id,
+      'total_questions': total
+    }), 201
 
   '''
-  @TODO: 
-  Create a POST endpoint to get questions to play the quiz. 
-  This endpoint should take category and previous question parameters 
-  and return a random questions within the given category, 
-  if provided, and that is not one of the previous questions. 
-
-  TEST: In the "Play" tab, after a user selects "All" or a category,
-  one question at a time is displayed, the user is allowed to answer
-  and shown whether they were correct or not. 
+  POST /quizzes/sessions/<session_id>/next
+      the next question of the quiz, question is null when it is over
   '''
+  @app.route('/quizzes/sessions/<session_id>/next', methods=['POST'])
+  def next_quiz_question(session_id):
+    while True:
+      try:
+        question_id, remaining = quiz_sessions.next(session_id)
+      except KeyError:
+        abort(404)
+      if question_id is None:
+        question = None
+        break
+      # skip the questions deleted since the quiz started
+      question = Question.query.get(question_id)
+      if question is not None:
+        break
+
+    return jsonify({
+      'success': True,
+      'question': question.format() if question is not None else None,
+      'remaining_questions': remaining
+    })
+
+  @app.route('/quizzes/sessions/<session_id>', methods=['DELETE'])
+  def delete_quiz_session(session_id):
+    quiz_sessions.delete(session_id)
+    return jsonify({
+      'success': True,
+      'deleted': session_id
+    })
 
   '''
   @TODO: 
   Create error handlers for all expected errors 
   including 404 and 422. 
   '''
+  @app.errorhandler(400)
+  def bad_request(error):
+    return jsonify({
+      'success': False,
+      'error': 400,
+      'message': 'bad request'
+    }), 400
+
+  @app.errorhandler(404)
+  def not_found(error):
+    return jsonify({
+      'success': False,
+      'error': 404,
+      'message': 'resource not found'
+    }), 404
+
+  @app.errorhandler(422)
+  def unprocessable(error):
+    return jsonify({
+      'success': False,
+      'error': 422,
+      'message': 'unprocessable'
+    }), 422
   
   return app
 
@@ -0,0 +1,59 @@
+import array
+import random
+import secrets
+import threading
+import time
+from collections import OrderedDict
+
+'''
+QuizSessions
+    server-side state of the quizzes being played: the ids of the questions
+    not asked yet, shuffled once into an int array, so the next question is
+    a pop and the client sends nothing but the session id
+'''
+class QuizSessions:
+  def __init__(self, ttl=3600, max_sessions=100000):
+    self.ttl = ttl
+    self.max_sessions = max_sessions
+    self.lock = threading.Lock()
+    # session id -> (expires, remaining ids), least recently played first
+    self.sessions = OrderedDict()
+
+  def create(self, question_ids):
+    remaining = array.array('l', question_ids)
+    random.shuffle(remaining)
+    session_id = secrets.token_urlsafe(16)
+    with self.lock:
+      self._evict()
+      self.sessions[session_id] = (time.monotonic() + self.ttl, remaining)
+      while len(self.sessions) > self.max_sessions:
+        self.sessions.popitem(last=False)
+    return session_id, len(remaining)
+
+  '''
+  next(session_id)
+      (question id, number left after it), the id is None once the quiz is
+      over; raises KeyError for unknown or expired sessions
+  '''
+  def next(self, session_id):
+    with self.lock:
+      self._evict()
+      expires, remaining = self.sessions[session_id]
+      self.sessions[session_id] = (time.monotonic() + self.ttl, remaining)
+      self.sessions.move_to_end(session_id)
+      if not remaining:
+        return None, 0
+      return remaining.pop(), len(remaining)
+
+  def delete(self, session_id):
+    with self.lock:
+      self.sessions.pop(session_id, None)
+
+  # sessions are kept in expiry order, the expired ones are at the front
+  def _evict(self):
+    now = time.monotonic()
+    while self.sessions:
+      session_id, (expires, remaining) = next(iter(self.sessions.items()))
+      if expires >= now:
+        break
+      del self.sessions[session_id]
@@ -1,8 +1,12 @@
 import os
-from sqlalchemy import Column, String, Integer, create_engine
+import random
+import threading
+from sqlalchemy import Column, String, Integer, ForeignKey, create_engine, func, event, DDL
 from flask_sqlalchemy import SQLAlchemy
 import json
 
+from search import InvertedIndex
+
 database_name = "trivia"
 database_path = "postgres://{}/{}".format('localhost:5432', database_name)
 
@@ -29,7 +33,7 @@ class Question(db.Model):
   id = Column(Integer, primary_key=True)
   question = Column(String)
   answer = Column(String)
-  category = Column(String)
+  category = Column(Integer, ForeignKey('categories.id', onupdate='CASCADE', ondelete='SET NULL'), index=True)
   difficulty = Column(Integer)
 
   def __init__(self, question, answer, category, difficulty):
@@ -41,13 +45,32 @@ class Question(db.Model):
   def insert(self):
     db.session.add(self)
     db.session.commit()
+    question_counts.invalidate()
+    question_pool.add(self.id, self.category)
+    question_index.invalidate()
   
   def update(self):
     db.session.commit()
+    question_counts.invalidate()
+    # the category may have changed, the pool reloads
+    question_pool.invalidate()
+    question_index.invalidate()
 
   def delete(self):
     db.session.delete(self)
     db.session.commit()
+    question_counts.invalidate()
+    question_pool.remove(self.id, self.category)
+    question_index.invalidate()
+
+  '''
+  search_document()
+      the tsvector of the question text; the expression of the
+      ix_questions_search GIN index, queries must use it verbatim to hit it
+  '''
+  @classmethod
+  def search_document(cls):
+    return func.to_tsvector('english', func.coalesce(cls.question, ''))
 
   def format(self):
     return {
@@ -58,6 +81,178 @@ class Question(db.Model):
       'difficulty': self.difficulty
     }
 
+# full-text index of the question text, only Postgres has to_tsvector();
+# other databases search through question_index
+event.listen(Question.__table__, 'after_create', DDL(
+  "CREATE INDEX ix_questions_search ON questions "
+  "USING gin (to_tsvector('english', coalesce(question, '')))"
+).execute_if(dialect='postgresql'))
+
+# in-process fallback of ix_questions_search
+question_index = InvertedIndex()
+
+'''
+QuestionCounts
+    total and per category number of questions, counted with one GROUP BY
+    the first time they are needed and kept until a question is written
+'''
+class QuestionCounts:
+  def __init__(self):
+    self.lock = threading.Lock()
+    self.counts = None
+
+  def by_category(self):
+    with self.lock:
+      if self.counts is None:
+        rows = db.session.query(Question.category, func.count(Question.id))\
+          .group_by(Question.category)\
+          .all()
+        self.counts = dict(rows)
+      return self.counts
+
+  def total(self):
+    return sum(self.by_category().values())
+
+  def category(self, category):
+    return self.by_category().get(category, 0)
+
+  def invalidate(self):
+    with self.lock:
+      self.counts = None
+
+question_counts = QuestionCounts()
+
+'''
+QuestionPool
+    ids of the questions of every category (and of all of them under None) in
+    arrays, so that a random quiz question is an index away; kept up to date
+    by Question.insert()/delete() once loaded
+'''
+class QuestionPool:
+  # random picks tried before scanning for the few questions left
+  MAX_REJECTIONS = 16
+  # key of the ids of all the questions, None is the key of the questions
+  # whose category was deleted
+  ALL = object()
+
+  def __init__(self):
+    self.lock = threading.Lock()
+    self.ids = None
+    self.positions = None
+    self.loading = False
+    # bumped on every write, a load racing with one is discarded
+    self.generation = 0
+
+  @property
+  def cold(self):
+    return self.ids is None
+
+  def rebuild(self, rows, generation):
+    ids = {self.ALL: []}
+    positions = {self.ALL: {}}
+    for id, category in rows:
+      for key in (self.ALL, category):
+        positions.setdefault(key, {})[id] = len(ids.setdefault(key, []))
+        ids[key].append(id)
+    with self.lock:
+      self.loading = False
+      if generation == self.generation:
+        self.ids = ids
+        self.positions = positions
+
+  '''
+  warm(app)
+      loads the pool on a background thread, requests meanwhile fall back
+      to SQL
+  '''
+  def warm(self, app):
+    with self.lock:
+      if not self.cold or self.loading:
+        return
+      self.loading = True
+      generation = self.generation
+
+    def load():
+      try:
+        with app.app_context():
+          rows = db.session.query(Question.id, Question.category).all()
+          db.session.remove()
+        self.rebuild(rows, generation)
+      except Exception:
+        with self.lock:
+          self.loading = False
+        raise
+
+    threading.Thread(target=load, daemon=True).start()
+
+  def add(self, id, category):
+    with self.lock:
+      self.generation += 1
+      if self.cold:
+        return
+      for key in (self.ALL, category):
+        self.positions.setdefault(key, {})[id] = len(self.ids.setdefault(key, []))
+        self.ids[key].append(id)
+
+  def remove(self, id, category):
+    with self.lock:
+      self.generation += 1
+      if self.cold:
+        return
+      for key in (self.ALL, category):
+        ids = self.ids.get(key, [])
+        position = self.positions.get(key, {}).pop(id, None)
+        if position is None:
+          continue
+        # fill the hole with the last id, keeps removal O(1)
+        last = ids.pop()
+        if last != id:
+          ids[position] = last
+          self.positions[key][last] = position
+
+  def invalidate(self):
+    with self.lock:
+      self.generation += 1
+      self.ids = None
+      self.positions = None
+
+  # copy of the ids of a category (None for all); raises LookupError when cold
+  def category_ids(self, category):
+    with self.lock:
+      if self.cold:
+        raise LookupError('question pool is not loaded')
+      return list(self.ids.get(self.ALL if category is None else category, []))
+
+  '''
+  pick(category, excluded)
+      a random id of the category (None for any) not in the excluded set,
+      None when every question was excluded; raises LookupError when cold
+  '''
+  def pick(self, category, excluded):
+    with self.lock:
+      if self.cold:
+        raise LookupError('question pool is not loaded')
+      key = self.ALL if category is None else category
+      ids = self.ids.get(key, [])
+      positions = self.positions.get(key, {})
+
+    remaining = len(ids) - sum(1 for id in excluded if id in positions)
+    if remaining <= 0:
+      return None
+    for _ in range(self.MAX_REJECTIONS):
+      try:
+        id = ids[random.randrange(len(ids))]
+      except (IndexError, ValueError):
+        # shrunk by a concurrent delete
+        break
+      if id not in excluded:
+        return id
+    # almost everything was excluded, pick among what is left
+    candidates = [id for id in list(ids) if id not in excluded]
+    return random.choice(candidates) if candidates else None
+
+question_pool = QuestionPool()
+
 '''
 Category
 
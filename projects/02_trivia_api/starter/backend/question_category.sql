@@ -0,0 +1,45 @@
+--
+-- Turns questions.category into an indexed integer foreign key to
+-- categories.id, for databases created while it was a text column (those
+-- restored from trivia.psql already have the integer column and only get
+-- the index):
+--
+--   psql trivia < question_category.sql
+--
+-- Text categories holding an id keep it, those holding a category type are
+-- mapped to its id, anything else becomes NULL.
+--
+
+BEGIN;
+
+DO $$
+BEGIN
+    IF (SELECT data_type FROM information_schema.columns
+        WHERE table_schema = 'public' AND table_name = 'questions' AND column_name = 'category') <> 'integer' THEN
+        ALTER TABLE public.questions ADD COLUMN category_id integer;
+
+        UPDATE public.questions SET category_id = CASE
+            WHEN category ~ '^\s*\d+\s*$' THEN trim(category)::integer
+            ELSE (SELECT id FROM public.categories WHERE lower(type) = lower(trim(questions.category)))
+        END;
+        -- ids without a category would fail the foreign key
+        UPDATE public.questions SET category_id = NULL
+        WHERE category_id NOT IN (SELECT id FROM public.categories);
+
+        ALTER TABLE public.questions DROP COLUMN category;
+        ALTER TABLE public.questions RENAME COLUMN category_id TO category;
+    END IF;
+
+    IF NOT EXISTS (SELECT 1 FROM information_schema.table_constraints
+                   WHERE table_schema = 'public' AND table_name = 'questions'
+                   AND constraint_type = 'FOREIGN KEY') THEN
+        ALTER TABLE public.questions
+            ADD CONSTRAINT questions_category_fkey FOREIGN KEY (category)
+            REFERENCES public.categories(id) ON UPDATE CASCADE ON DELETE SET NULL;
+    END IF;
+END
+$$;
+
+CREATE INDEX IF NOT EXISTS ix_questions_category ON public.questions (category);
+
+COMMIT;
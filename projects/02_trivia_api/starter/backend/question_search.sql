@@ -0,0 +1,11 @@
+--
+-- Full-text search index of the questions, for databases restored from
+-- trivia.psql (db.create_all() creates it with new tables only):
+--
+--   psql trivia < question_search.sql
+--
+-- The expression must match Question.search_document() in models.py.
+--
+
+CREATE INDEX IF NOT EXISTS ix_questions_search ON public.questions
+    USING gin (to_tsvector('english', coalesce(question, '')));
@@ -0,0 +1,60 @@
+import re
+import threading
+from collections import Counter, defaultdict
+
+# words plainto_tsquery('english', ...) drops as well, a query made only of
+# them finds nothing in either engine
+STOP_WORDS = frozenset('''
+a an and are as at be by did do does for from had has have how in is it its
+of on or that the their this to was were what when where which who whom why
+with would
+'''.split())
+
+'''
+tokenize(text)
+    lowercased words of a text without the stop words
+'''
+def tokenize(text):
+  return [word for word in re.findall(r'\w+', (text or '').lower()) if word not in STOP_WORDS]
+
+'''
+InvertedIndex
+    in-process full-text index of the questions, used when the database is
+    not Postgres (e.g. SQLite in tests); matches every word of the query and
+    ranks by how often they occur, like plainto_tsquery() and ts_rank()
+'''
+class InvertedIndex:
+  def __init__(self):
+    self.lock = threading.Lock()
+    self.postings = defaultdict(dict)
+    # set when the questions changed, the owner rebuilds the index lazily
+    self.stale = True
+
+  def rebuild(self, rows):
+    postings = defaultdict(dict)
+    for id, text in rows:
+      for word, count in Counter(tokenize(text)).items():
+        postings[word][id] = count
+    with self.lock:
+      self.postings = postings
+      self.stale = False
+
+  def invalidate(self):
+    self.stale = True
+
+  '''
+  search(term, limit, offset)
+      (number of matches, ids of the requested page of them, best first)
+  '''
+  def search(self, term, limit, offset=0):
+    words = set(tokenize(term))
+    if not words:
+      return 0, []
+    with self.lock:
+      # intersect starting from the rarest word, the smallest posting list
+      lists = sorted((self.postings.get(word, {}) for word in words), key=len)
+      ids = set(lists[0])
+      for postings in lists[1:]:
+        ids.intersection_update(postings)
+      ranked = sorted(ids, key=lambda id: (-sum(postings[id] for postings in lists), id))
+    return len(ranked), ranked[offset:offset + limit]
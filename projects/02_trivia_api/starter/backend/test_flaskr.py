@@ -33,6 +33,196 @@ class TriviaTestCase(unittest.TestCase):
     TODO
     Write at least one test for each test for successful operation and for expected errors.
     """
+    def test_get_paginated_questions(self):
+        res = self.client().get('/questions')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertTrue(data['total_questions'])
+        self.assertLessEqual(len(data['questions']), 10)
+        self.assertTrue(len(data['categories']))
+
+    def test_questions_cursor_continues_after_last_page_question(self):
+        res = self.client().get('/questions')
+        first = json.loads(res.data)
+        res = self.client().get('/questions?cursor={}'.format(first['next_cursor']))
+        second = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertGreater(second['questions'][0]['id'], first['questions'][-1]['id'])
+        self.assertEqual(second['total_questions'], first['total_questions'])
+
+    def test_400_invalid_questions_cursor(self):
+        res = self.client().get('/questions?cursor=not-a-cursor')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 400)
+        self.assertEqual(data['success'], False)
+
+    def test_404_requesting_beyond_valid_page(self):
+        res = self.client().get('/questions?page=1000')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 404)
+        self.assertEqual(data['success'], False)
+        self.assertEqual(data['message'], 'resource not found')
+
+    def test_delete_question_updates_total(self):
+        question = Question('test question', 'test answer', 1, 1)
+        with self.app.app_context():
+            total = json.loads(self.client().get('/questions').data)['total_questions']
+            question.insert()
+            question_id = question.id
+
+        res = self.client().delete('/questions/{}'.format(question_id))
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['deleted'], question_id)
+        self.assertEqual(data['total_questions'], total)
+
+    def test_404_delete_missing_question(self):
+        res = self.client().delete('/questions/100000')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 404)
+        self.assertEqual(data['success'], False)
+
+    def test_play_quiz(self):
+        res = self.client().post('/quizzes', json={'previous_questions': [], 'quiz_category': {'id': 1, 'type': 'Science'}})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertEqual(data['question']['category'], 1)
+
+    def test_quiz_never_repeats_previous_questions(self):
+        previous_questions = []
+        while True:
+            res = self.client().post('/quizzes', json={'previous_questions': previous_questions, 'quiz_category': {'id': 0, 'type': 'click'}})
+            question = json.loads(res.data)['question']
+            if question is None:
+                break
+            self.assertNotIn(question['id'], previous_questions)
+            previous_questions.append(question['id'])
+
+        self.assertEqual(len(previous_questions), json.loads(self.client().get('/questions').data)['total_questions'])
+
+    def test_400_quiz_with_invalid_previous_questions(self):
+        res = self.client().post('/quizzes', json={'previous_questions': 'all', 'quiz_category': {'id': 0}})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 400)
+        self.assertEqual(data['success'], False)
+
+    def test_quiz_session_asks_every_question_once(self):
+        res = self.client().post('/quizzes/sessions', json={'quiz_category': {'id': 1, 'type': 'Science'}})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 201)
+        self.assertTrue(data['session_id'])
+
+        asked = []
+        for _ in range(data['total_questions'] + 1):
+            res = self.client().post('/quizzes/sessions/{}/next'.format(data['session_id']))
+            question = json.loads(res.data)['question']
+            if question is None:
+                break
+            asked.append(question['id'])
+
+        self.assertEqual(len(asked), len(set(asked)))
+        self.assertEqual(len(asked), data['total_questions'])
+
+    def test_404_quiz_session_of_missing_category(self):
+        res = self.client().post('/quizzes/sessions', json={'quiz_category': {'id': 1000, 'type': 'Unknown'}})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 404)
+        self.assertEqual(data['success'], False)
+
+    def test_404_next_question_of_unknown_quiz_session(self):
+        res = self.client().post('/quizzes/sessions/unknown/next')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 404)
+        self.assertEqual(data['success'], False)
+
+    def test_search_questions(self):
+        res = self.client().post('/questions', json={'searchTerm': 'title'})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(data['total_questions'])
+        for question in data['questions']:
+            self.assertIn('title', question['question'].lower())
+
+    def test_search_questions_without_results(self):
+        res = self.client().post('/questions', json={'searchTerm': 'xyzzyplugh'})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['total_questions'], 0)
+        self.assertEqual(data['questions'], [])
+
+    def test_create_question(self):
+        res = self.client().post('/questions', json={'question': 'test question', 'answer': 'test answer', 'category': 1, 'difficulty': 1})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 201)
+        self.assertTrue(data['created'])
+        self.client().delete('/questions/{}'.format(data['created']))
+
+    def test_422_create_question_without_answer(self):
+        res = self.client().post('/questions', json={'question': 'test question', 'category': 1, 'difficulty': 1})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 422)
+        self.assertEqual(data['success'], False)
+
+    def test_get_category_questions(self):
+        res = self.client().get('/categories/1/questions')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['current_category']['id'], 1)
+        self.assertTrue(data['total_questions'])
+        for question in data['questions']:
+            self.assertEqual(question['category'], 1)
+
+    def test_404_questions_of_missing_category(self):
+        res = self.client().get('/categories/1000/questions')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 404)
+        self.assertEqual(data['success'], False)
+
+    def test_422_create_question_with_unknown_category(self):
+        res = self.client().post('/questions', json={'question': 'test question', 'answer': 'test answer', 'category': 1000, 'difficulty': 1})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 422)
+        self.assertEqual(data['success'], False)
+
+    def test_quiz_session_asks_uncategorized_question_once(self):
+        question = Question('uncategorized question', 'test answer', None, 1)
+        with self.app.app_context():
+            question.insert()
+            question_id = question.id
+
+        res = self.client().post('/quizzes/sessions', json={'quiz_category': {'id': 0, 'type': 'click'}})
+        data = json.loads(res.data)
+        asked = []
+        for _ in range(data['total_questions'] + 1):
+            res = self.client().post('/quizzes/sessions/{}/next'.format(data['session_id']))
+            next_question = json.loads(res.data)['question']
+            if next_question is None:
+                break
+            asked.append(next_question['id'])
+
+        self.client().delete('/questions/{}'.format(question_id))
+        self.assertEqual(asked.count(question_id), 1)
+        self.assertEqual(len(asked), len(set(asked)))
 
 
 # Make the tests conveniently executable